@@ -1,24 +1,144 @@
-from dataclasses import dataclass
-from queue import PriorityQueue
+import json
+import os
+import subprocess
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+from dataclasses import asdict, dataclass
+from functools import cached_property
+from heapq import heappop, heappush
+from itertools import count
 from time import perf_counter
-
-from anytree import AnyNode
-from anytree.exporter import DotExporter
 from typing import Callable
 
 
 # AStarNode est une classe qui représente un nœud dans l'algorithme de recherche A*
 class AStarNode:
 
-    def __lt__(self, other):
-        return False
-
     def children(self) -> list:
         """
         :return: Une liste des enfants du nœud.
         """
         return []
 
+    def predecessors(self) -> list:
+        """
+        Utilisé par la recherche bidirectionnelle pour remonter depuis le but.
+        Par défaut les déplacements sont réversibles : les prédécesseurs sont les enfants.
+
+        :return: La liste des nœuds dont ce nœud est un enfant.
+        """
+        return self.children()
+
+    def key(self):
+        """
+        :return: Une valeur qui identifie le nœud : deux nœuds sont égaux si et seulement si leurs clés le sont.
+        """
+        return self
+
+    def moves(self) -> list:
+        """
+        Génération paresseuse des fils, utilisée par le mode économe de a_star_search : les fils déjà connus
+        sont écartés par leur clé, et seuls les autres sont construits avec apply.
+        Par défaut la clé et le déplacement sont le fils lui-même.
+
+        :return: Une liste de couples (clé du fils, déplacement), dans l'ordre de children().
+        """
+        return [(child, child) for child in self.children()]
+
+    def apply(self, move) -> "AStarNode":
+        """
+        :param move: Un déplacement donné par moves()
+        :return: Le fils obtenu par ce déplacement.
+        """
+        return move
+
+    def can_reach(self, target: "AStarNode") -> bool:
+        """
+        Test rapide appelé avant une recherche. Par défaut on ne sait pas conclure : le but est peut-être atteignable.
+
+        :param target: L'état du but
+        :return: False si on sait que le but ne peut pas être atteint depuis ce nœud.
+        """
+        return True
+
+
+# StateIndex est une numérotation parfaite des états d'un domaine, utilisée par le mode économe d'A*
+class StateIndex(ABC):
+    size: int = 0  # Nombre de rangs : chaque état atteignable a un rang dans range(size)
+
+    @abstractmethod
+    def rank(self, key) -> int:
+        """
+        :param key: La clé d'un état (voir AStarNode.key)
+        :return: Le rang de l'état, différent pour deux états différents.
+        """
+
+
+class RankedIds:
+    """
+    Numéros des états d'une recherche, indexés par leur rang (voir StateIndex).
+
+    Si l'espace est petit, c'est un seul tableau de {size} entiers. Sinon les rangs d'une recherche sont trop
+    dispersés pour être paginés : c'est une table de hachage à adressage ouvert, rangée dans deux tableaux
+    (rangs et numéros) remplis au plus à moitié, dont la taille double au besoin.
+    """
+
+    def __init__(self, size: int, flat_limit: int = 1 << 24, capacity: int = 1 << 16):
+        """
+        :param size: Nombre de rangs
+        :param flat_limit: Nombre de rangs au-delà duquel on utilise la table de hachage
+        :param capacity: Taille initiale de la table de hachage, une puissance de deux
+        """
+        if size <= flat_limit:
+            self.flat = array("i", [-1]) * size
+        else:
+            self.flat = None
+            self.count = 0
+            self._allocate(capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        self.ranks = array("q", [-1]) * capacity
+        self.values = array("i", [0]) * capacity
+        self.mask = capacity - 1
+
+    def _slot(self, rank: int) -> int:
+        # Les rangs voisins sont dispersés dans la table (hachage multiplicatif), puis sondage linéaire
+        ranks = self.ranks
+        mask = self.mask
+        slot = ((rank * 0x9E3779B97F4A7C15) >> 32) & mask
+        while ranks[slot] != rank and ranks[slot] != -1:
+            slot = (slot + 1) & mask
+        return slot
+
+    def get(self, rank: int) -> int or None:
+        if self.flat is not None:
+            value = self.flat[rank]
+            return None if value < 0 else value
+
+        slot = self._slot(rank)
+        return None if self.ranks[slot] == -1 else self.values[slot]
+
+    def __setitem__(self, rank: int, value: int) -> None:
+        if self.flat is not None:
+            self.flat[rank] = value
+            return
+
+        slot = self._slot(rank)
+        if self.ranks[slot] == -1:
+            self.count += 1
+            if 2 * self.count > len(self.ranks):
+                old_ranks, old_values = self.ranks, self.values
+                self._allocate(2 * len(old_ranks))
+                for old_rank, old_value in zip(old_ranks, old_values):
+                    if old_rank != -1:
+                        new_slot = self._slot(old_rank)
+                        self.ranks[new_slot] = old_rank
+                        self.values[new_slot] = old_value
+                slot = self._slot(rank)
+            self.ranks[slot] = rank
+        self.values[slot] = value
+
 
 # AStarResult est une classe qui contient le résultat de l'algorithme A*
 @dataclass(frozen=True)
@@ -31,6 +151,136 @@ class AStarResult:
     parent: {AStarNode: AStarNode}
     visited: {AStarNode: int}
     steps: int = 0
+    stats: "SearchStats" or None = None
+    bound: float = 1  # Le coût du chemin est au plus bound fois le coût optimal (si h est admissible)
+
+    @cached_property
+    def path_nodes(self) -> set:
+        """
+        :return: Les nœuds du chemin, pour un test d'appartenance en O(1).
+        """
+        return set(self.path)
+
+
+# SearchStats contient les compteurs et temps mesurés pendant une recherche
+@dataclass
+class SearchStats:
+    expansions: int = 0  # Nœuds développés (un nœud rouvert compte plusieurs fois)
+    generations: int = 0  # Fils générés
+    duplicates: int = 0  # Fils déjà connus, sans meilleur chemin
+    reopenings: int = 0  # Nœuds déjà développés atteints par un chemin plus court
+    open_peak: int = 0  # Taille maximale de la liste ouverte
+    heuristic_calls: int = 0
+    heuristic_time: float = 0
+    successor_time: float = 0  # Temps passé dans children()
+    total_time: float = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict())
+
+
+def incremental(update: Callable[[any, any, any, float], float]):
+    """
+    Associe à une heuristique sa mise à jour incrémentale.
+
+    update(parent, child, target, h_parent) renvoie l'heuristique de {child} à partir de celle de son
+    parent, sans tout recalculer. Les recherches l'utilisent quand elle existe, et appellent
+    l'heuristique complète sinon.
+
+    :param update: La fonction de mise à jour
+    :return: Un décorateur qui ajoute l'attribut update à l'heuristique.
+    """
+
+    def decorator(h):
+        h.update = update
+        return h
+
+    return decorator
+
+
+def batched(batch: Callable[[list, any], list[float]]):
+    """
+    Associe à une heuristique son évaluation groupée.
+
+    batch(states, target) renvoie l'heuristique de chacun des états de la liste {states} en un seul appel,
+    typiquement vectorisé avec numpy. a_star_search l'utilise quand on lui donne un batch_size.
+
+    :param batch: La fonction d'évaluation groupée
+    :return: Un décorateur qui ajoute l'attribut batch à l'heuristique.
+    """
+
+    def decorator(h):
+        h.batch = batch
+        return h
+
+    return decorator
+
+
+# Marqueur d'une entrée du tas qui n'est plus valide (suppression paresseuse)
+_REMOVED = object()
+
+
+class OpenList:
+    """
+    Liste des nœuds ouverts de l'algorithme A*.
+
+    Tas binaire (heapq) non synchronisé : chaque nœud n'y a qu'une entrée valide.
+    Remettre un nœud déjà présent invalide l'ancienne entrée (diminution de clé par suppression paresseuse),
+    les entrées invalides étant ignorées au moment du retrait.
+    À f égal, les nœuds sortent dans l'ordre d'insertion, ou par h croissant si tie_break_h est vrai.
+    """
+
+    def __init__(self, tie_break_h: bool = False):
+        self.heap = []
+        self.entries = {}  # nœud -> entrée valide dans le tas
+        self.counter = count()
+        self.tie_break_h = tie_break_h
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, node) -> bool:
+        return node in self.entries
+
+    def push(self, node, f: float, h: float = 0) -> None:
+        """
+        Ajoute un nœud, ou met à jour sa priorité s'il est déjà présent
+
+        :param node: Le nœud à ajouter
+        :param f: La priorité du nœud
+        :param h: L'heuristique du nœud, utilisée pour départager les f égaux
+        """
+        entry = self.entries.get(node)
+        if entry is not None:
+            entry[-1] = _REMOVED
+
+        entry = [f, h if self.tie_break_h else 0, next(self.counter), node]
+        self.entries[node] = entry
+        heappush(self.heap, entry)
+
+    def pop(self):
+        """
+        Retire le nœud de plus petite priorité
+
+        :return: Le nœud retiré.
+        """
+        while self.heap:
+            node = heappop(self.heap)[-1]
+            if node is not _REMOVED:
+                del self.entries[node]
+                return node
+        raise KeyError("pop from an empty open list")
+
+    def min_f(self) -> float:
+        """
+        :return: La plus petite priorité de la liste, ou l'infini si elle est vide.
+        """
+        while self.heap and self.heap[0][-1] is _REMOVED:
+            heappop(self.heap)
+        return self.heap[0][0] if self.heap else float("inf")
 
 
 def build_path(parent: {AStarNode: AStarNode}, current: AStarNode) -> list:
@@ -54,7 +304,17 @@ def build_path(parent: {AStarNode: AStarNode}, current: AStarNode) -> list:
 def a_star_search(from_state: AStarNode,
                   to_state: AStarNode,
                   h: Callable[[any, any], float],
-                  cost: float = 1) -> AStarResult or None:
+                  cost: float = 1,
+                  tie_break_h: bool = False,
+                  stats: SearchStats or None = None,
+                  callback: Callable[[SearchStats], None] or None = None,
+                  callback_every: int = 1000,
+                  lean: bool = False,
+                  weight: float = 1,
+                  known_paths: Callable[[any, any], list or None] or None = None,
+                  batch_size: int or None = None,
+                  successors: Callable[[any, any], list] or None = None,
+                  index: StateIndex or None = None) -> AStarResult or None:
     """
     Réalise une recherche A* pour trouver le chemin le plus court entre deux point.
     La fonction heuristique est utilisée pour estimer la distance entre le nœud actuel et le nœud cible.
@@ -65,6 +325,25 @@ def a_star_search(from_state: AStarNode,
     :type to_state: AStarNode
     :param h: la fonction heuristique
     :param cost: coût d'avancement dans une branche
+    :param tie_break_h: à f égal, développer d'abord le nœud de plus petit h
+    :param stats: Les compteurs à remplir, utile pour les lire même quand aucun chemin n'est trouvé
+    :param callback: Fonction appelée avec les compteurs tous les {callback_every} nœuds développés
+    :param callback_every: Période d'appel de {callback}
+    :param lean: Mode économe : les nœuds sont numérotés et g, h, le parent et le coup depuis le parent sont
+        rangés dans des tableaux indexés par ce numéro, sans garder l'ordre de passage ni les états fermés. Le résultat ne contient que le chemin
+        (g_score et parent restreints au chemin, h_score et visited vides) et ne permet donc pas render_tree.
+    :param weight: A* pondéré : on développe par f = g + weight * h. Avec une heuristique admissible,
+        le chemin trouvé coûte au plus weight fois l'optimum, en développant en général beaucoup moins de nœuds.
+    :param known_paths: Chemins déjà connus : known_paths(node, to_state) renvoie un chemin optimal de {node}
+        au but, ou None. La recherche s'arrête dès qu'elle développe un tel nœud et termine par ce chemin,
+        ce qui reste optimal si h vaut exactement le coût de ce chemin sur ces nœuds (voir DistanceCache).
+    :param batch_size: Mode groupé, si l'heuristique a une évaluation groupée (voir batched) : on développe
+        jusqu'à {batch_size} nœuds de même f avant de calculer l'heuristique de tous leurs fils en un appel.
+    :param successors: Génération des fils hors d'AStarNode : successors(node, parent) renvoie la liste des couples
+        (fils, coût du pas), parent valant None pour la racine. Les nœuds peuvent alors être de simples entiers
+        (voir Grid), et {cost} n'est pas utilisé. Incompatible avec les modes lean et batch_size.
+    :param index: Pour le mode lean, une numérotation parfaite des états (voir TaquinIndex) : les numéros des
+        nœuds sont rangés dans un tableau indexé par le rang des états au lieu d'un dictionnaire.
     :return: AStarResult est un tuple nommé avec les champs suivants:
         - root : le nœud racine de l'arbre de recherche
         - path: le chemin de la racine au nœud de but
@@ -72,11 +351,30 @@ def a_star_search(from_state: AStarNode,
         - h_score: le score h du nœud de but
         - steps: le nombre d'étapes
         - visited: l'ordre de passage d'un nœud
+        - stats: les compteurs de la recherche
+        - bound: la garantie de sous-optimalité, égale à weight
     """
+    if stats is None:
+        stats = SearchStats()
+    if successors is not None:
+        if lean or batch_size is not None:
+            raise ValueError("successors n'est pas utilisable avec les modes lean et batch_size")
+    elif not from_state.can_reach(to_state):  # Inutile de parcourir tout l'espace atteignable
+        return None
+    if index is not None and not lean:
+        raise ValueError("index n'est utilisable qu'avec le mode lean")
+    if lean:
+        return _lean_a_star_search(from_state, to_state, h, cost, tie_break_h, stats, callback, callback_every,
+                                   weight, known_paths, index)
+    if batch_size is not None and getattr(h, "batch", None) is not None:
+        return _batched_a_star_search(from_state, to_state, h, cost, tie_break_h, stats, callback, callback_every,
+                                      weight, known_paths, batch_size)
+    t_start = perf_counter()
 
     from_state_g = 0
     from_state_h = h(from_state, to_state)
-    from_state_f = from_state_g + from_state_h  # f = g + h
+    from_state_f = from_state_g + weight * from_state_h  # f = g + h
+    stats.heuristic_calls += 1
 
     parent = {}  # Liste des parents pour pouvoir faire le chemin inverse à la fin
 
@@ -84,20 +382,32 @@ def a_star_search(from_state: AStarNode,
     h_score: {AStarNode: float} = {from_state: from_state_h}
     visited: {AStarNode: int} = {}  # Peut correspondre à une liste de nœuds fermés
 
-    f_score = PriorityQueue()  # Peut correspondre à une liste de nœuds ouverts
+    open_list = OpenList(tie_break_h)  # Liste des nœuds ouverts
+    open_list.push(from_state, from_state_f, from_state_h)
 
-    # Tuple = (f, g, h, value). Seuls f et value sont utiles, mais on garde toutes les valeurs pour le debug
-    f_score.put((from_state_f, from_state))
+    update = getattr(h, "update", None)  # Mise à jour incrémentale de l'heuristique, si elle existe
 
     steps = 0
 
     # Tant qu'on a des états à essayer
-    while f_score:
-        _, current = f_score.get()  # On récupère l'état avec le plus petit heuristic (et on le retire)
+    while open_list:
+        stats.open_peak = max(stats.open_peak, len(open_list))
+        current = open_list.pop()  # On récupère l'état avec le plus petit f (et on le retire)
+
+        if current not in visited:  # Un nœud rouvert garde son ordre de premier passage
+            visited[current] = len(visited)
 
-        visited[current] = len(visited)
+        if known_paths is not None and current != to_state:
+            known_path = known_paths(current, to_state)
+            if known_path is not None:
+                # On complète la recherche avec le chemin connu jusqu'au but
+                for node, next_node in zip(known_path, known_path[1:]):
+                    g_score[next_node] = g_score[node] + cost
+                    parent[next_node] = node
+                current = to_state
 
         if current == to_state:  # Si c'est l'état cible, on s'arrête là
+            stats.total_time += perf_counter() - t_start
             # On ajoute les informations au résultat et on le retourne
             return AStarResult(
                 from_state,
@@ -107,25 +417,54 @@ def a_star_search(from_state: AStarNode,
                 h_score,
                 parent,
                 visited,
-                steps
+                steps,
+                stats,
+                weight
             )
 
+        stats.expansions += 1
+        if callback is not None and stats.expansions % callback_every == 0:
+            callback(stats)
+
         g_current = g_score[current]
+        h_current = h_score[current]
+
+        t_successor = perf_counter()
+        if successors is None:
+            children_list = current.children()
+        else:
+            children_list = successors(current, parent.get(current))
+        stats.successor_time += perf_counter() - t_successor
+
         # Sinon on essaie tous les fils de l'état actuel dans notre liste
-        for children in current.children():
+        for children in children_list:
+            if successors is None:
+                g_child = g_current + cost  # Chaque avancement dans une branche a un coût
+            else:
+                children, step_cost = children
+                g_child = g_current + step_cost
+
             if children == current:
                 continue
 
             steps += 1
-
-            g_child = g_current + cost  # Chaque avancement dans une branche a un coût
+            stats.generations += 1
 
             # Si le score actuel est meilleur que le score précédent (ou qu'il n'y en a pas)
             # ça veut dire qu'on a atteint le nœud plus haut que précédemment
             if children not in g_score or g_child < g_score[children]:
 
-                h_child = h(children, to_state)
-                f_child = h_child + g_child
+                if children in h_score:
+                    h_child = h_score[children]
+                else:
+                    t_heuristic = perf_counter()
+                    if update is not None:
+                        h_child = update(current, children, to_state, h_current)
+                    else:
+                        h_child = h(children, to_state)
+                    stats.heuristic_time += perf_counter() - t_heuristic
+                    stats.heuristic_calls += 1
+                f_child = weight * h_child + g_child
 
                 h_score[children] = h_child
                 g_score[children] = g_child
@@ -133,65 +472,705 @@ def a_star_search(from_state: AStarNode,
                 parent[
                     children] = current  # On change le lien de parenté avec l'ancien nœud, comme ce chemin est plus court
 
-                if children not in visited:  # On n'ajoute à la file que si l'état n'a pas déjà été testé précédemment
-                    f_score.put((f_child, children))
+                if children in visited:
+                    stats.reopenings += 1
+
+                # On (r)ouvre le nœud : s'il avait déjà été testé, le chemin trouvé est plus court
+                open_list.push(children, f_child, h_child)
+            else:
+                stats.duplicates += 1
 
+    stats.total_time += perf_counter() - t_start
     return None
 
 
+def _lean_a_star_search(from_state: AStarNode,
+                        to_state: AStarNode,
+                        h: Callable[[any, any], float],
+                        cost: float,
+                        tie_break_h: bool,
+                        stats: SearchStats,
+                        callback: Callable[[SearchStats], None] or None,
+                        callback_every: int,
+                        weight: float,
+                        known_paths: Callable[[any, any], list or None] or None,
+                        index: StateIndex or None) -> AStarResult or None:
+    """
+    Mode économe de a_star_search : chaque état reçoit un numéro à sa première génération,
+    ses scores et son parent sont rangés dans des tableaux compacts indexés par ce numéro.
+
+    Les états ne sont gardés que tant qu'ils sont ouverts : pour chaque numéro, on ne retient que le parent,
+    le coup qui y mène depuis ce parent et les scores. Le chemin est reconstruit en rejouant ces coups depuis
+    {from_state}. Avec {index}, le numéro d'un état est retrouvé par son rang, sans hacher d'objet.
+
+    Les fils sont générés par moves() : un fils déjà connu sans meilleur chemin est écarté par sa clé,
+    sans être construit. Le domaine doit redéfinir key() et moves() (voir TaquinState et MachineState) :
+    par défaut la clé et le coup sont le fils lui-même, et tous les états restent alors en mémoire.
+    """
+    t_start = perf_counter()
+
+    if index is None:
+        ids = {from_state.key(): 0}  # Numéro de chaque état, par clé
+        rank = None
+    else:
+        ids = RankedIds(index.size)
+        rank = index.rank
+        ids[rank(from_state.key())] = 0
+    states: {int: AStarNode} = {0: from_state}  # États ouverts, par numéro
+    parents = array("i", [-1])
+    moves = [None]  # Coup qui mène de son parent à chaque état
+    g_score = array("d", [0])
+    h_score = array("d", [h(from_state, to_state)])
+    closed = bytearray(1)
+    stats.heuristic_calls += 1
+
+    open_list = OpenList(tie_break_h)  # Contient des numéros d'états
+    open_list.push(0, weight * h_score[0], h_score[0])
+
+    update = getattr(h, "update", None)
+
+    steps = 0
+
+    while open_list:
+        stats.open_peak = max(stats.open_peak, len(open_list))
+        current_id = open_list.pop()
+        current = states.pop(current_id)
+
+        known_path = None
+        if known_paths is not None and current != to_state:
+            known_path = known_paths(current, to_state)
+
+        if current == to_state or known_path is not None:
+            path_ids = [current_id]
+            while parents[path_ids[-1]] != -1:
+                path_ids.append(parents[path_ids[-1]])
+            path_ids.reverse()
+            path = [from_state]
+            for i in path_ids[1:-1]:
+                path.append(path[-1].apply(moves[i]))
+            if len(path_ids) > 1:
+                path.append(current)
+            g_path = [g_score[i] for i in path_ids]
+
+            if known_path is not None:  # On complète avec le chemin connu jusqu'au but
+                for node in known_path[1:]:
+                    path.append(node)
+                    g_path.append(g_path[-1] + cost)
+
+            stats.total_time += perf_counter() - t_start
+            return AStarResult(
+                from_state,
+                to_state,
+                path,
+                dict(zip(path, g_path)),
+                {},
+                {node: path[i] for i, node in enumerate(path[1:])},
+                {},
+                steps,
+                stats,
+                weight
+            )
+
+        closed[current_id] = 1
+
+        stats.expansions += 1
+        if callback is not None and stats.expansions % callback_every == 0:
+            callback(stats)
+
+        g_current = g_score[current_id]
+        h_current = h_score[current_id]
+
+        current_key = current.key()
+        t_successor = perf_counter()
+        move_list = current.moves()
+        stats.successor_time += perf_counter() - t_successor
+
+        for key, move in move_list:
+            if key == current_key:
+                continue
+
+            steps += 1
+            stats.generations += 1
+
+            g_child = g_current + cost
+            if rank is not None:
+                key = rank(key)
+            child_id = ids.get(key)
+
+            if child_id is None:  # Nouvel état : on le construit et on lui donne un numéro
+                children = current.apply(move)
+                t_heuristic = perf_counter()
+                if update is not None:
+                    h_child = update(current, children, to_state, h_current)
+                else:
+                    h_child = h(children, to_state)
+                stats.heuristic_time += perf_counter() - t_heuristic
+                stats.heuristic_calls += 1
+
+                child_id = len(parents)
+                ids[key] = child_id
+                states[child_id] = children
+                parents.append(current_id)
+                moves.append(move)
+                g_score.append(g_child)
+                h_score.append(h_child)
+                closed.append(0)
+            elif g_child < g_score[child_id]:
+                h_child = h_score[child_id]
+                g_score[child_id] = g_child
+                parents[child_id] = current_id
+                moves[child_id] = move
+                if closed[child_id]:
+                    stats.reopenings += 1
+                if child_id not in states:  # L'état a été oublié à son développement
+                    states[child_id] = current.apply(move)
+            else:
+                stats.duplicates += 1
+                continue
+
+            open_list.push(child_id, g_child + weight * h_child, h_child)
+
+    stats.total_time += perf_counter() - t_start
+    return None
+
+
+def _batched_a_star_search(from_state: AStarNode,
+                           to_state: AStarNode,
+                           h: Callable[[any, any], float],
+                           cost: float,
+                           tie_break_h: bool,
+                           stats: SearchStats,
+                           callback: Callable[[SearchStats], None] or None,
+                           callback_every: int,
+                           weight: float,
+                           known_paths: Callable[[any, any], list or None] or None,
+                           batch_size: int) -> AStarResult or None:
+    """
+    Mode groupé de a_star_search : on retire de la liste ouverte jusqu'à {batch_size} nœuds de même f,
+    on les développe tous, puis l'heuristique des fils jamais vus est calculée par un seul appel à h.batch.
+    L'ordre de développement des nœuds de même f est libre, le chemin trouvé reste donc optimal.
+    """
+    t_start = perf_counter()
+    batch = h.batch
+
+    from_state_h = batch([from_state], to_state)[0]
+    stats.heuristic_calls += 1
+
+    parent = {}
+    g_score: {AStarNode: float} = {from_state: 0}
+    h_score: {AStarNode: float} = {from_state: from_state_h}
+    visited: {AStarNode: int} = {}
+
+    open_list = OpenList(tie_break_h)
+    open_list.push(from_state, weight * from_state_h, from_state_h)
+
+    steps = 0
+
+    while open_list:
+        stats.open_peak = max(stats.open_peak, len(open_list))
+
+        # Les nœuds de plus petit f, développés ensemble
+        f_batch = open_list.min_f()
+        expanded = []
+        while open_list and open_list.min_f() == f_batch and len(expanded) < batch_size:
+            current = open_list.pop()
+            if current not in visited:
+                visited[current] = len(visited)
+
+            if known_paths is not None and current != to_state:
+                known_path = known_paths(current, to_state)
+                if known_path is not None:
+                    for node, next_node in zip(known_path, known_path[1:]):
+                        g_score[next_node] = g_score[node] + cost
+                        parent[next_node] = node
+                    current = to_state
+
+            if current == to_state:
+                stats.total_time += perf_counter() - t_start
+                return AStarResult(
+                    from_state,
+                    to_state,
+                    build_path(parent, current),
+                    g_score,
+                    h_score,
+                    parent,
+                    visited,
+                    steps,
+                    stats,
+                    weight
+                )
+
+            expanded.append(current)
+
+        pending = {}  # Fils dont l'heuristique reste à calculer (dictionnaire utilisé comme ensemble ordonné)
+        for current in expanded:
+            stats.expansions += 1
+            if callback is not None and stats.expansions % callback_every == 0:
+                callback(stats)
+
+            g_current = g_score[current]
+
+            t_successor = perf_counter()
+            children_list = current.children()
+            stats.successor_time += perf_counter() - t_successor
+
+            for children in children_list:
+                if children == current:
+                    continue
+
+                steps += 1
+                stats.generations += 1
+
+                g_child = g_current + cost
+                if children not in g_score or g_child < g_score[children]:
+                    g_score[children] = g_child
+                    parent[children] = current
+                    if children in visited:
+                        stats.reopenings += 1
+
+                    if children in h_score:
+                        open_list.push(children, g_child + weight * h_score[children], h_score[children])
+                    else:
+                        pending[children] = None
+                else:
+                    stats.duplicates += 1
+
+        if pending:
+            states = list(pending)
+            t_heuristic = perf_counter()
+            values = batch(states, to_state)
+            stats.heuristic_time += perf_counter() - t_heuristic
+            stats.heuristic_calls += len(states)
+
+            for children, h_child in zip(states, values):
+                h_score[children] = h_child
+                open_list.push(children, g_score[children] + weight * h_child, h_child)
+
+    stats.total_time += perf_counter() - t_start
+    return None
+
+
+def ara_star_search(from_state: AStarNode,
+                    to_state: AStarNode,
+                    h: Callable[[any, any], float],
+                    cost: float = 1,
+                    weight: float = 3,
+                    weight_step: float = 0.5,
+                    time_budget: float or None = None,
+                    callback: Callable[[AStarResult], None] or None = None,
+                    stats: SearchStats or None = None) -> AStarResult or None:
+    """
+    Réalise une recherche ARA* (A* pondéré à amélioration continue).
+
+    Une première recherche pondérée par {weight} trouve vite un chemin, puis le poids est diminué de {weight_step}
+    jusqu'à 1 et chaque nouvelle recherche repart des scores déjà calculés : seuls les nœuds dont g a diminué
+    depuis leur développement (les nœuds incohérents) sont rouverts. Après chaque passe, la garantie
+    est min(weight, coût du chemin / plus petit g + h des nœuds ouverts ou incohérents).
+
+    :param from_state: L'état initial à partir duquel commencer la recherche
+    :type from_state: AStarNode
+    :param to_state: L'état du but
+    :type to_state: AStarNode
+    :param h: la fonction heuristique, admissible pour que la garantie ait un sens
+    :param cost: coût d'avancement dans une branche
+    :param weight: Le poids de la première recherche
+    :param weight_step: La diminution du poids entre deux recherches
+    :param time_budget: Temps maximal en secondes, après lequel on renvoie le meilleur chemin trouvé
+    :param callback: Fonction appelée avec le résultat après chaque passe qui a trouvé un chemin
+    :param stats: Les compteurs à remplir
+    :return: Le meilleur AStarResult trouvé, dont bound est la garantie atteinte (1 si le chemin est optimal).
+        g_score, h_score, parent et visited ne contiennent que les nœuds du chemin. None si aucun chemin
+        n'a été trouvé dans le temps imparti.
+    """
+    if stats is None:
+        stats = SearchStats()
+    if not from_state.can_reach(to_state):
+        return None
+    t_start = perf_counter()
+    deadline = None if time_budget is None else t_start + time_budget
+
+    g_score: {AStarNode: float} = {from_state: 0}
+    h_score: {AStarNode: float} = {from_state: h(from_state, to_state)}
+    parent: {AStarNode: AStarNode} = {}
+    stats.heuristic_calls += 1
+
+    update = getattr(h, "update", None)
+
+    open_list = OpenList()
+    open_list.push(from_state, weight * h_score[from_state], h_score[from_state])
+    closed = set()
+    incons = set()  # Nœuds fermés dont g a diminué pendant la passe courante
+    best = None
+    steps = 0
+
+    def goal_f() -> float:
+        if to_state not in g_score:
+            return float("inf")
+        return g_score[to_state] + weight * h_score[to_state]
+
+    while True:
+        # Passe pondérée par {weight}, jusqu'à ce que le but soit le meilleur nœud ouvert
+        timed_out = False
+        while open_list and goal_f() > open_list.min_f():
+            if deadline is not None and perf_counter() >= deadline:
+                timed_out = True
+                break
+
+            current = open_list.pop()
+            closed.add(current)
+            stats.expansions += 1
+            g_current = g_score[current]
+
+            t_successor = perf_counter()
+            children_list = current.children()
+            stats.successor_time += perf_counter() - t_successor
+
+            for children in children_list:
+                if children == current:
+                    continue
+
+                steps += 1
+                stats.generations += 1
+                g_child = g_current + cost
+
+                if children in g_score and g_child >= g_score[children]:
+                    stats.duplicates += 1
+                    continue
+
+                if children not in h_score:
+                    t_heuristic = perf_counter()
+                    if update is not None:
+                        h_score[children] = update(current, children, to_state, h_score[current])
+                    else:
+                        h_score[children] = h(children, to_state)
+                    stats.heuristic_time += perf_counter() - t_heuristic
+                    stats.heuristic_calls += 1
+
+                g_score[children] = g_child
+                parent[children] = current
+                if children in closed:
+                    incons.add(children)  # Rouvert seulement à la passe suivante
+                    stats.reopenings += 1
+                else:
+                    open_list.push(children, g_child + weight * h_score[children], h_score[children])
+
+        if to_state in g_score and not timed_out:
+            # Borne inférieure de l'optimum : le plus petit g + h parmi les nœuds qui restent à développer
+            lower = min((g_score[node] + h_score[node] for node in (*open_list.entries, *incons)),
+                        default=float("inf"))
+            goal_g = g_score[to_state]
+            bound = max(1, min(weight, goal_g / lower)) if lower > 0 else weight
+
+            if best is None or goal_g < best.g_score[to_state] or bound < best.bound:
+                path = build_path(parent, to_state)
+                best = AStarResult(
+                    from_state,
+                    to_state,
+                    path,
+                    {node: g_score[node] for node in path},
+                    {node: h_score[node] for node in path},
+                    {node: path[i] for i, node in enumerate(path[1:])},
+                    {node: i for i, node in enumerate(path)},
+                    steps,
+                    stats,
+                    bound
+                )
+                if callback is not None:
+                    callback(best)
+
+        if timed_out or weight <= 1 or (best is not None and best.bound <= 1):
+            break
+
+        # Passe suivante : poids diminué, nœuds incohérents rouverts, f recalculés
+        weight = max(1, weight - weight_step)
+        new_open_list = OpenList()
+        for node in (*open_list.entries, *incons):
+            new_open_list.push(node, g_score[node] + weight * h_score[node], h_score[node])
+        open_list = new_open_list
+        incons = set()
+        closed = set()
+
+    stats.total_time += perf_counter() - t_start
+    return best
+
+
+def bidirectional_a_star_search(from_state: AStarNode,
+                                to_state: AStarNode,
+                                h: Callable[[any, any], float],
+                                cost: float = 1,
+                                h_backward: Callable[[any, any], float] or None = None) -> AStarResult or None:
+    """
+    Réalise une recherche A* bidirectionnelle : une recherche part de l'état initial vers le but
+    (avec h(state, to_state)), l'autre remonte du but vers l'état initial en suivant predecessors()
+    (avec h_backward(state, from_state)). On développe à chaque fois le côté qui a le moins de nœuds ouverts.
+
+    Le meilleur chemin trouvé par une rencontre des deux recherches est optimal dès que son coût ne dépasse
+    plus le plus petit f de l'une des deux listes ouvertes (les heuristiques doivent être admissibles).
+
+    :param from_state: L'état initial à partir duquel commencer la recherche
+    :type from_state: AStarNode
+    :param to_state: L'état du but
+    :type to_state: AStarNode
+    :param h: la fonction heuristique, vers le but
+    :param cost: coût d'avancement dans une branche
+    :param h_backward: la fonction heuristique vers l'état initial, par défaut {h}.
+        Une heuristique qui ignore son second argument (le but) doit être remplacée ici.
+    :return: AStarResult dont le chemin relie les deux recherches au point de rencontre.
+        g_score et h_score sont ceux de la recherche avant, visited regroupe les nœuds fermés des deux côtés.
+    """
+    if not from_state.can_reach(to_state):
+        return None
+    if h_backward is None:
+        h_backward = h
+
+    # Les deux recherches, avant (vers le but) et arrière (vers l'état initial)
+    forward = _Frontier(from_state, to_state, h, lambda node: node.children())
+    backward = _Frontier(to_state, from_state, h_backward, lambda node: node.predecessors())
+
+    visited: {AStarNode: int} = {}
+    steps = 0
+
+    best_cost = 0 if from_state == to_state else float("inf")  # Coût du meilleur chemin trouvé
+    meeting = from_state if from_state == to_state else None  # Nœud où les deux recherches se rencontrent
+
+    while forward.open_list and backward.open_list:
+        if best_cost <= max(forward.open_list.min_f(), backward.open_list.min_f()):
+            break
+
+        side, other = (forward, backward) if len(forward.open_list) <= len(backward.open_list) \
+            else (backward, forward)
+
+        current = side.open_list.pop()
+        if current not in visited:
+            visited[current] = len(visited)
+
+        g_current = side.g_score[current]
+        for children in side.expand(current):
+            if children == current:
+                continue
+
+            steps += 1
+
+            g_child = g_current + cost
+
+            if children not in side.g_score or g_child < side.g_score[children]:
+                if children not in side.h_score:
+                    side.h_score[children] = side.h(children, side.target)
+                h_child = side.h_score[children]
+
+                side.g_score[children] = g_child
+                side.parent[children] = current
+                side.open_list.push(children, g_child + h_child, h_child)
+
+                # Si l'autre recherche a déjà atteint ce nœud, on a un chemin complet
+                if children in other.g_score and g_child + other.g_score[children] < best_cost:
+                    best_cost = g_child + other.g_score[children]
+                    meeting = children
+
+    if meeting is None:
+        return None
+
+    # Le chemin avant jusqu'au point de rencontre, puis le chemin arrière jusqu'au but
+    path = build_path(forward.parent, meeting)
+    current = meeting
+    while current in backward.parent:
+        current = backward.parent[current]
+        path.append(current)
+
+    parent = dict(forward.parent)
+    for previous, node in zip(path, path[1:]):
+        parent[node] = previous
+
+    return AStarResult(
+        from_state,
+        to_state,
+        path,
+        forward.g_score,
+        forward.h_score,
+        parent,
+        visited,
+        steps
+    )
+
+
+class _Frontier:
+    """
+    État d'une des deux recherches de bidirectional_a_star_search
+    """
+
+    def __init__(self, root: AStarNode, target: AStarNode, h: Callable[[any, any], float],
+                 expand: Callable[[AStarNode], list]):
+        self.target = target
+        self.h = h
+        self.expand = expand
+
+        root_h = h(root, target)
+        self.g_score: {AStarNode: float} = {root: 0}
+        self.h_score: {AStarNode: float} = {root: root_h}
+        self.parent: {AStarNode: AStarNode} = {}
+
+        self.open_list = OpenList()
+        self.open_list.push(root, root_h, root_h)
+
+
+def ida_star_search(from_state: AStarNode,
+                    to_state: AStarNode,
+                    h: Callable[[any, any], float],
+                    cost: float = 1) -> AStarResult or None:
+    """
+    Réalise une recherche IDA* (A* par approfondissement itératif).
+
+    Succession de parcours en profondeur limités par un seuil sur f = g + h, le seuil suivant étant
+    le plus petit f qui a dépassé le seuil courant. Seul le chemin courant est gardé en mémoire,
+    la mémoire utilisée est donc proportionnelle à la profondeur de la solution.
+
+    :param from_state: L'état initial à partir duquel commencer la recherche
+    :type from_state: AStarNode
+    :param to_state: L'état du but
+    :type to_state: AStarNode
+    :param h: la fonction heuristique
+    :param cost: coût d'avancement dans une branche
+    :return: AStarResult dont g_score, h_score, parent et visited ne contiennent que les nœuds du chemin,
+        steps étant le nombre total de nœuds générés sur toutes les itérations.
+    """
+    if not from_state.can_reach(to_state):  # IDA* ne s'arrêterait jamais
+        return None
+
+    from_state_h = h(from_state, to_state)
+    bound = from_state_h
+    steps = 0
+
+    update = getattr(h, "update", None)  # Mise à jour incrémentale de l'heuristique, si elle existe
+
+    while True:
+        path = [from_state]
+        h_path = [from_state_h]
+        on_path = {from_state}  # Pour ne pas reboucler sur un nœud du chemin (dont le parent)
+        stack = [iter(from_state.children())]  # Les fils restant à essayer à chaque profondeur
+
+        next_bound = float("inf")
+        found = from_state == to_state
+
+        while stack and not found:
+            child = next(stack[-1], None)
+
+            if child is None:  # Tous les fils ont été essayés, on remonte
+                stack.pop()
+                h_path.pop()
+                on_path.remove(path.pop())
+                continue
+
+            if child in on_path:
+                continue
+
+            steps += 1
+
+            g_child = len(path) * cost
+            if update is not None:
+                h_child = update(path[-1], child, to_state, h_path[-1])
+            else:
+                h_child = h(child, to_state)
+            f_child = g_child + h_child
+
+            if f_child > bound:  # On retient le plus petit dépassement pour la prochaine itération
+                next_bound = min(next_bound, f_child)
+                continue
+
+            path.append(child)
+            h_path.append(h_child)
+            on_path.add(child)
+
+            if child == to_state:
+                found = True
+            else:
+                stack.append(iter(child.children()))
+
+        if found:
+            return AStarResult(
+                from_state,
+                to_state,
+                path,
+                {node: i * cost for i, node in enumerate(path)},
+                dict(zip(path, h_path)),
+                {node: path[i] for i, node in enumerate(path[1:])},
+                {node: i for i, node in enumerate(path)},
+                steps
+            )
+
+        if next_bound == float("inf"):  # Plus aucun nœud à explorer
+            return None
+
+        bound = next_bound
+
+
+def _dot_node(file, index: int, node: AStarNode, result: AStarResult,
+              node_content: Callable[[AStarNode, AStarResult], str],
+              node_attr: Callable[[AStarNode, AStarResult], str]) -> None:
+    """
+    Écrit la déclaration d'un nœud au format DOT
+    """
+    label = node_content(node, result).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    attr = node_attr(node, result)
+    file.write(f'  n{index} [label="{label}"{", " + attr if attr else ""}];\n')
+
+
+def _to_picture(dot_file: str, picture_file: str) -> None:
+    """
+    Convertit un fichier DOT en image avec Graphviz
+    """
+    subprocess.run(["dot", "-Tpng", dot_file, "-o", picture_file], check=True)
+
+
 def render_tree(result: AStarResult,
                 node_content: Callable[[AStarNode, AStarResult], str],
                 node_attr: Callable[[AStarNode, AStarResult], str],
                 file_name: str,
-                unvisited_nodes) -> None:
+                unvisited_nodes,
+                max_nodes: int or None = None) -> None:
     """
     Génère une image à partir d'un résultat A*
 
+    L'arbre est celui des parents enregistrés pendant la recherche : chaque nœud apparaît une fois,
+    sous le parent de son meilleur chemin. Il est parcouru en largeur et écrit au fur et à mesure
+    dans {file_name}.dot, puis converti en image par Graphviz.
+
     :param result: AStarRésultat
     :param node_content: Une fonction qui renvoie le contenu du nœud
     :param node_attr: Une fonction qui prend un nœud et un résultat A* et renvoie une chaîne d'attributs HTML pour le nœud
     :param file_name: Nom du fichier dans lequel enregistrer l'image
     :param unvisited_nodes: Est-ce qu'on affiche les nœuds non visités
     :type unvisited_nodes: True or False
+    :param max_nodes: Nombre maximal de nœuds dessinés, les plus proches de la racine (le chemin est toujours dessiné)
     """
 
-    def add_node(node: AStarNode,
-                 already: list[AStarNode],
-                 show_unvisited_nodes: bool,
-                 parent: AnyNode or None = None) -> AnyNode:
-        """
-        Ajouter un nœud au résultat ainsi que ses fils s'ils ne sont pas déjà dans l'arbre
-
-        :param node: Le nœud à ajouter à l'arborescence
-        :type node: AStarNode
-        :param already: La liste des nœuds qui ont déjà été visités
-        :type already: list[AStarNode]
-        :param show_unvisited_nodes: Est-ce qu'on affiche les nœuds non visités
-        :type show_unvisited_nodes: True or False
-        :param parent: Le nœud parent
-        :type parent: AnyNode or None
-        :return: Un objet AnyNode.
-        """
-        already.append(node)
-        n = AnyNode(node=node, parent=parent)
-        for child in node.children():
-            if child == node:
-                continue
-            if show_unvisited_nodes and child not in result.visited:
-                already.append(node)
-                AnyNode(node=child, parent=n)
-                continue
-            if child in result.visited and child not in already:
-                add_node(child, already, show_unvisited_nodes, parent=n)
+    # Les fils de chaque nœud, dans l'ordre de génération
+    children: {AStarNode: list[AStarNode]} = {}
+    for node, node_parent in result.parent.items():
+        if unvisited_nodes or node in result.visited:
+            children.setdefault(node_parent, []).append(node)
+
+    _make_dirs(file_name)
+    ids: {AStarNode: int} = {result.root: 0}
+    queue = deque([result.root])
+
+    with open(file_name + ".dot", "w") as file:
+        file.write("digraph tree {\n")
+        _dot_node(file, 0, result.root, result, node_content, node_attr)
 
-        return n
+        while queue:
+            node = queue.popleft()
+            for child in children.get(node, []):
+                if max_nodes is not None and len(ids) >= max_nodes and child not in result.path_nodes:
+                    continue
 
-    root = add_node(result.root, [], unvisited_nodes)
+                ids[child] = len(ids)
+                _dot_node(file, ids[child], child, result, node_content, node_attr)
+                file.write(f"  n{ids[node]} -> n{ids[child]};\n")
+                queue.append(child)
 
-    DotExporter(root,
-                nodenamefunc=lambda n: node_content(n.node, result),
-                nodeattrfunc=lambda n: node_attr(n.node, result)
-                ).to_picture(file_name + ".png")
+        file.write("}\n")
+
+    _to_picture(file_name + ".dot", file_name + ".png")
 
 
 def render_path(result: AStarResult,
@@ -208,26 +1187,26 @@ def render_path(result: AStarResult,
     :param file_name: Nom du fichier dans lequel enregistrer l'image
     """
 
-    def add_node(node: AStarNode,
-                 already: list[AStarNode],
-                 parent: AnyNode or None = None) -> AnyNode:
-        already.append(node)
-        n = AnyNode(node=node)
+    _make_dirs(file_name)
+
+    with open(file_name + "_path.dot", "w") as file:
+        file.write("digraph path {\n")
 
-        if parent:
-            parent.children = [n]
+        # Le chemin est dessiné du but vers la racine
+        for index, node in enumerate(reversed(result.path)):
+            _dot_node(file, index, node, result, node_content, node_attr)
+            if index:
+                file.write(f"  n{index - 1} -> n{index};\n")
 
-        if node in result.parent:
-            add_node(result.parent[node], already, parent=n)
+        file.write("}\n")
 
-        return n
+    _to_picture(file_name + "_path.dot", file_name + "_path.png")
 
-    root = add_node(result.target, [])
 
-    DotExporter(root,
-                nodenamefunc=lambda n: node_content(n.node, result),
-                nodeattrfunc=lambda n: node_attr(n.node, result)
-                ).to_picture(file_name + "_path.png")
+def _make_dirs(file_name: str) -> None:
+    directory = os.path.dirname(file_name)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
 
 
 def def_node_attr(node: AStarNode, result: AStarResult) -> str:
@@ -247,7 +1226,7 @@ def def_node_attr(node: AStarNode, result: AStarResult) -> str:
     if node not in result.visited:
         return "style=\"dotted\""
 
-    if node in result.path:
+    if node in result.path_nodes:
         return "color=red,style=filled, fillcolor=\"#0000000f\""
 
     return ""
@@ -260,17 +1239,19 @@ def wrap_search(from_state: AStarNode,
                 render_node: Callable[[any, any], str],
                 render_attr: Callable[[any, any], str],
                 file_name: str,
-                unvisited_nodes: bool = True):
-    t_start = perf_counter()
-
+                unvisited_nodes: bool = True,
+                weight: float = 1):
     print("----")
     print(f"Début de la recherche {file_name}")
-    path = a_star_search(from_state, to_state, h, cost)
-    t_delta = perf_counter() - t_start
-    print(f"Temps d'execution : {t_delta:.5f} secondes")
-    print(f"Temps par noeud : {t_delta / path.steps:.5f} secondes")
-    print(f"Nombre de noeuds visités : {path.steps}")
-    print(f"Nombre de noeuds parcourus : {len(path.visited)}")
+    stats = SearchStats()
+    path = a_star_search(from_state, to_state, h, cost, stats=stats, weight=weight)
+    print(f"Temps d'execution : {stats.total_time:.5f} secondes")
+    if stats.generations:
+        print(f"Temps par noeud : {stats.total_time / stats.generations:.5f} secondes")
+    print(f"Nombre de noeuds visités : {stats.generations}")
+    print(f"Nombre de noeuds parcourus : {stats.expansions}")
+    print(f"Temps heuristique / génération des fils : "
+          f"{stats.heuristic_time:.5f} / {stats.successor_time:.5f} secondes")
 
     if path is None:
         print("Aucun chemin trouvé")
@@ -0,0 +1,219 @@
+import argparse
+import json
+import resource
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+from typing import Callable
+
+from a_star import a_star_search, ara_star_search, bidirectional_a_star_search, ida_star_search
+from distance_cache import DistanceCache
+from external import external_a_star_search
+from machine import MachineState, above_heuristic, goal_heuristic
+from pattern_db import PatternDatabase
+from taquin import TaquinState, hamming, manhattan
+
+# Les moteurs de recherche utilisables dans une instance
+SEARCHES = {
+    "a_star": a_star_search,
+    "ida_star": ida_star_search,
+    "bidirectional": bidirectional_a_star_search,
+    "ara_star": ara_star_search,
+    "external": external_a_star_search,
+}
+
+
+class SearchTimeout(Exception):
+    """
+    Levée dans un processus de calcul quand une instance dépasse son temps limite
+    """
+
+
+def zero(_, __) -> float:
+    return 0
+
+
+def taquin_heuristic(name: str, goal: TaquinState):
+    if name == "manhattan":
+        return manhattan
+    if name == "hamming":
+        return hamming
+    if name == "pdb":
+        return PatternDatabase.open(goal)
+    if name == "zero":
+        return zero
+    raise ValueError(f"Heuristique inconnue pour le taquin : {name}")
+
+
+def machine_heuristic(spec: str or dict, goal: MachineState):
+    # Une heuristique est soit un nom, soit {"base": 6, "terms": [["A", "B", 1], ...]} (voir above_heuristic)
+    if spec == "zero":
+        return zero
+    if spec == "goal":
+        return goal_heuristic(goal)
+    if isinstance(spec, dict):
+        return above_heuristic(spec["base"], [tuple(term) for term in spec["terms"]])
+    raise ValueError(f"Heuristique inconnue pour la machine : {spec}")
+
+
+def machine_state(value: dict) -> MachineState:
+    return MachineState(value.get("arm"), value["stacks"], value["max_stacks"])
+
+
+# Pour chaque domaine : la construction d'un état à partir du JSON, et celle de l'heuristique
+DOMAINS = {
+    "taquin": (TaquinState.from_rows, taquin_heuristic),
+    "machine": (machine_state, machine_heuristic),
+}
+
+
+def _raise_timeout(signum, frame):
+    raise SearchTimeout()
+
+
+def _limit_memory(memory: int or None) -> None:
+    """
+    Initialisation d'un processus de calcul : limite sa mémoire à {memory} Mo
+    """
+    if memory is not None:
+        limit = memory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def solve(instance: dict,
+          timeout: float or None = None,
+          heuristic: Callable[[str, any, any], Callable] or None = None,
+          cache: DistanceCache or None = None) -> dict:
+    """
+    Résout une instance et renvoie un résumé sérialisable du résultat
+
+    :param instance: Un dictionnaire avec les clés domain, start, goal, heuristic,
+        et optionnellement id, cost (1 par défaut), search (a_star par défaut) et options, les paramètres
+        supplémentaires de la recherche (par exemple {"weight": 2} ou {"time_budget": 0.01} pour ara_star)
+    :param timeout: Temps limite en secondes
+    :param heuristic: Construction de l'heuristique à partir du domaine, de sa spécification et du but,
+        par défaut celle de DOMAINS
+    :param cache: Cache des distances exactes, utilisé par les recherches a_star sans options. L'heuristique
+        doit être admissible, et le cache réservé à un seul coût d'avancement
+    :return: Un dictionnaire avec l'état de la résolution (solved, unsolvable, no_path, timeout, memory ou error),
+        la longueur et le coût du chemin, le nombre de nœuds générés et développés (expanded, absent pour les
+        recherches qui ne les comptent pas), et le temps de calcul.
+    """
+    result = {"id": instance.get("id")}
+    t_start = perf_counter()
+
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        parse = DOMAINS[instance["domain"]][0]
+        start = parse(instance["start"])
+        goal = parse(instance["goal"])
+        cost = instance.get("cost", 1)
+
+        # Rejet immédiat, avant de construire l'heuristique (une base de motifs peut être longue à calculer)
+        if not start.can_reach(goal):
+            result["status"] = "unsolvable"
+        else:
+            if heuristic is None:
+                h = DOMAINS[instance["domain"]][1](instance["heuristic"], goal)
+            else:
+                h = heuristic(instance["domain"], instance["heuristic"], goal)
+
+            search = instance.get("search", "a_star")
+            options = instance.get("options", {})
+            if search == "bidirectional" and isinstance(instance["heuristic"], dict):
+                # Les termes de above_heuristic décrivent le but : la recherche arrière n'aurait pas d'heuristique
+                raise ValueError("La recherche bidirectionnelle a besoin d'une heuristique qui utilise son but")
+            if cache is not None and search == "a_star" and not options:
+                path = cache.search(start, goal, h, cost)
+            else:
+                path = SEARCHES[search](start, goal, h, cost, **options)
+
+            if path is None:
+                result["status"] = "no_path"
+            else:
+                result["status"] = "solved"
+                result["length"] = len(path.path) - 1
+                result["cost"] = (len(path.path) - 1) * cost
+                result["bound"] = path.bound
+                result["steps"] = path.steps
+                # Seules les recherches qui remplissent SearchStats comptent leurs nœuds développés :
+                # visited ne contient parfois que le chemin (ida_star)
+                if path.stats is not None:
+                    result["expanded"] = path.stats.expansions
+                    result["stats"] = path.stats.as_dict()
+    except SearchTimeout:
+        result["status"] = "timeout"
+    except MemoryError:
+        result["status"] = "memory"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = repr(e)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    result["time"] = perf_counter() - t_start
+    return result
+
+
+def solve_batch(instances: list[dict],
+                workers: int or None = None,
+                timeout: float or None = None,
+                memory: int or None = None):
+    """
+    Résout des instances sur plusieurs processus, et renvoie les résultats au fur et à mesure qu'ils arrivent
+
+    :param instances: Les instances (voir solve)
+    :param workers: Nombre de processus, par défaut le nombre de cœurs
+    :param timeout: Temps limite de chaque instance, en secondes
+    :param memory: Mémoire maximale de chaque processus, en Mo
+    :return: Un itérateur sur les résultats, dans l'ordre où ils se terminent.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_limit_memory, initargs=(memory,)) as executor:
+        futures = {}
+        for i, instance in enumerate(instances):
+            if "id" not in instance:
+                instance = {**instance, "id": i}
+            futures[executor.submit(solve, instance, timeout)] = instance
+
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:  # Le processus de calcul a été arrêté (mémoire épuisée, signal...)
+                yield {"id": futures[future]["id"], "status": "error", "error": repr(e)}
+
+
+def read_instances(file_name: str) -> list[dict]:
+    """
+    :param file_name: Un fichier JSON lines, une instance par ligne
+    :return: La liste des instances.
+    """
+    with open(file_name) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Résolution d'un lot d'instances sur plusieurs processus")
+    parser.add_argument("instances", help="Fichier JSON lines des instances")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Nombre de processus")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Temps limite par instance (s)")
+    parser.add_argument("-m", "--memory", type=int, default=None, help="Mémoire maximale par processus (Mo)")
+    parser.add_argument("-o", "--output", default=None, help="Fichier de résultats (sortie standard par défaut)")
+    args = parser.parse_args()
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for result in solve_batch(read_instances(args.instances), args.workers, args.timeout, args.memory):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+
+from a_star import SearchStats, a_star_search
+from batch import DOMAINS
+from machine import MachineState
+from taquin import TaquinState
+
+# Corpus : (lignes, colonnes, longueurs des marches aléatoires, heuristiques)
+TAQUIN_CORPUS = [
+    (3, 3, [10, 20, 40], ["hamming", "manhattan"]),
+    (3, 4, [20, 30], ["manhattan"]),
+    (4, 4, [20, 30], ["manhattan"]),
+    (4, 5, [20, 30], ["manhattan"]),
+    (5, 5, [20, 30], ["manhattan"]),
+]
+
+# Corpus : (nombre de blocs, longueurs des marches aléatoires, heuristiques)
+MACHINE_CORPUS = [
+    (3, [6, 12], ["zero", "above", "goal"]),
+    (5, [8, 16], ["zero", "above", "goal"]),
+    (7, [10, 20], ["zero", "above", "goal"]),
+    (10, [10, 20], ["above", "goal"]),
+    (15, [20, 40], ["goal"]),
+]
+
+# Nombre d'instances tirées par configuration
+INSTANCES_PER_CONFIG = 3
+
+# Écart de temps (en secondes) en dessous duquel une augmentation n'est pas une régression : beaucoup de recherches
+# durent moins d'une milliseconde, et leur temps varie bien plus que la tolérance d'une exécution à l'autre
+TIME_FLOOR = 0.005
+
+
+def random_walk(state, length: int, rng: random.Random):
+    """
+    Marche aléatoire depuis {state}, sans revenir sur l'état précédent
+
+    :param state: L'état de départ
+    :param length: Nombre de déplacements
+    :param rng: Générateur aléatoire
+    :return: L'état atteint.
+    """
+    previous = state
+    for _ in range(length):
+        children = [child for child in state.children() if child != previous] or state.children()
+        previous, state = state, rng.choice(children)
+    return state
+
+
+def goal_terms(goal: MachineState) -> list[tuple[str, str or None, float]]:
+    """
+    :return: Les termes de above_heuristic qui décrivent les piles du but, de poids 1.
+    """
+    terms = []
+    for stack in goal.stacks:
+        for i, block in enumerate(stack):
+            terms.append((block, stack[i + 1] if i + 1 < len(stack) else None, 1))
+    return terms
+
+
+def build_corpus(seed: int) -> list[dict]:
+    """
+    Construit le corpus de benchmark. Les instances sont obtenues par des marches aléatoires depuis le but,
+    le corpus ne dépend donc que de la graine.
+
+    :param seed: La graine du générateur aléatoire
+    :return: La liste des instances, au format de batch.solve.
+    """
+    rng = random.Random(seed)
+    corpus = []
+
+    for row_count, col_count, lengths, heuristics in TAQUIN_CORPUS:
+        values = list(range(1, row_count * col_count)) + [0]
+        goal = TaquinState.from_rows([values[y * col_count:(y + 1) * col_count] for y in range(row_count)])
+        for length in lengths:
+            for i in range(INSTANCES_PER_CONFIG):
+                start = random_walk(goal, length, rng)
+                for heuristic in heuristics:
+                    corpus.append({
+                        "id": f"taquin-{row_count}x{col_count}-walk{length}-{i}-{heuristic}",
+                        "domain": "taquin",
+                        "start": start.rows,
+                        "goal": goal.rows,
+                        "heuristic": heuristic,
+                    })
+
+    for block_count, lengths, heuristics in MACHINE_CORPUS:
+        blocks = [chr(ord('A') + i) for i in range(block_count)]
+        goal = MachineState(None, [blocks], 3)
+        for length in lengths:
+            for i in range(INSTANCES_PER_CONFIG):
+                # Un nombre pair de mouvements pour finir avec le bras vide
+                start = random_walk(goal, length - length % 2, rng)
+                for heuristic in heuristics:
+                    spec = {"base": block_count, "terms": goal_terms(goal)} if heuristic == "above" else heuristic
+                    corpus.append({
+                        "id": f"machine-{block_count}-walk{length}-{i}-{heuristic}",
+                        "domain": "machine",
+                        "start": {"arm": start.arm, "stacks": start.stacks, "max_stacks": start.max_stacks},
+                        "goal": {"arm": goal.arm, "stacks": goal.stacks, "max_stacks": goal.max_stacks},
+                        "heuristic": spec,
+                    })
+
+    return corpus
+
+
+def run(instance: dict, cost: float, memory: bool, repeats: int = 1) -> dict:
+    """
+    Mesure une instance : {repeats} recherches chronométrées, dont on garde le temps le plus court (le moins
+    perturbé par le reste du système), puis une dernière sous tracemalloc pour la mémoire
+    (tracemalloc ralentit fortement la recherche, les deux mesures sont donc séparées)
+
+    :param instance: L'instance
+    :param cost: Le coût d'avancement
+    :param memory: Est-ce qu'on mesure la mémoire maximale
+    :param repeats: Nombre de recherches chronométrées
+    :return: Les mesures.
+    """
+    parse, heuristic = DOMAINS[instance["domain"]]
+    start = parse(instance["start"])
+    goal = parse(instance["goal"])
+    h = heuristic(instance["heuristic"], goal)
+
+    stats = SearchStats()
+    t_start = perf_counter()
+    result = a_star_search(start, goal, h, cost, stats=stats)
+    wall_time = perf_counter() - t_start
+    for _ in range(repeats - 1):
+        t_start = perf_counter()
+        a_star_search(start, goal, h, cost)
+        wall_time = min(wall_time, perf_counter() - t_start)
+
+    measure = {
+        "id": instance["id"],
+        "cost": cost,
+        "time": wall_time,
+        "expansions": stats.expansions,
+        "generations": stats.generations,
+        "expansions_per_second": stats.expansions / wall_time if wall_time else 0,
+        "solution_cost": None if result is None else (len(result.path) - 1) * cost,
+    }
+    del result
+
+    if memory:
+        tracemalloc.start()
+        a_star_search(start, goal, h, cost)
+        measure["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return measure
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float, time_floor: float = TIME_FLOOR) -> list[str]:
+    """
+    Compare des mesures à une référence. Le nombre de nœuds développés et le coût de la solution
+    sont déterministes : ils sont comparés sans tolérance. Le temps peut augmenter de {tolerance} au plus,
+    ou de {time_floor} secondes pour les recherches très courtes.
+
+    :return: La liste des régressions.
+    """
+    reference = {(measure["id"], measure["cost"]): measure for measure in baseline}
+    regressions = []
+
+    for measure in results:
+        key = (measure["id"], measure["cost"])
+        if key not in reference:
+            continue
+        old = reference[key]
+
+        if measure["solution_cost"] != old["solution_cost"]:
+            regressions.append(f"{measure['id']} : coût {old['solution_cost']} -> {measure['solution_cost']}")
+        if measure["expansions"] > old["expansions"]:
+            regressions.append(f"{measure['id']} : nœuds développés {old['expansions']} -> {measure['expansions']}")
+        if measure["time"] > max(old["time"] * (1 + tolerance), old["time"] + time_floor):
+            regressions.append(f"{measure['id']} : temps {old['time']:.4f}s -> {measure['time']:.4f}s")
+        if "peak_memory" in measure and "peak_memory" in old \
+                and measure["peak_memory"] > old["peak_memory"] * (1 + tolerance):
+            regressions.append(f"{measure['id']} : mémoire {old['peak_memory']} -> {measure['peak_memory']}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la recherche A* sur le taquin et la machine")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Graine du corpus")
+    parser.add_argument("-c", "--costs", type=float, nargs="+", default=[1], help="Coûts d'avancement à mesurer")
+    parser.add_argument("-f", "--filter", default="", help="Ne mesure que les instances dont l'id contient ce texte")
+    parser.add_argument("--no-memory", action="store_true", help="Ne mesure pas la mémoire maximale")
+    parser.add_argument("-o", "--output", default=None, help="Fichier JSON où enregistrer les mesures")
+    parser.add_argument("-b", "--baseline", default=None, help="Fichier JSON de référence à comparer")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.25, help="Augmentation de temps tolérée")
+    parser.add_argument("--time-floor", type=float, default=TIME_FLOOR,
+                        help="Augmentation de temps toujours tolérée (s)")
+    parser.add_argument("-r", "--repeats", type=int, default=5,
+                        help="Nombre de recherches chronométrées par instance, on garde la plus courte")
+    args = parser.parse_args()
+
+    corpus = [instance for instance in build_corpus(args.seed) if args.filter in instance["id"]]
+
+    results = []
+    for instance in corpus:
+        for cost in args.costs:
+            measure = run(instance, cost, not args.no_memory, args.repeats)
+            results.append(measure)
+            print(f"{measure['id']:<40} cost={cost:<4g} {measure['time']:9.4f}s "
+                  f"{measure['expansions']:8d} nœuds {measure['expansions_per_second']:10.0f} nœuds/s "
+                  f"{measure.get('peak_memory', 0) / 1024:10.0f} Ko  solution={measure['solution_cost']}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({
+                "seed": args.seed,
+                "python": platform.python_version(),
+                "repeats": args.repeats,
+                "results": results,
+            }, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["seed"] != args.seed:
+            print(f"La référence a été mesurée avec la graine {baseline['seed']}")
+            sys.exit(2)
+
+        regressions = compare(results, baseline["results"], args.tolerance, args.time_floor)
+        for regression in regressions:
+            print(f"Régression : {regression}")
+        if regressions:
+            sys.exit(1)
+        print("Aucune régression")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import os
+import pickle
+import random
+from collections import OrderedDict
+from time import perf_counter
+from typing import Callable
+
+from a_star import AStarNode, AStarResult, a_star_search
+from taquin import TaquinState, manhattan
+
+
+class DistanceCache:
+    """
+    Cache des distances exactes au but, partagé entre plusieurs recherches.
+
+    Chaque chemin optimal enregistré donne, pour tous ses nœuds, la distance exacte au but et le
+    déplacement suivant. Une recherche faite avec search() utilise ces distances comme heuristique
+    parfaite, et s'arrête dès qu'elle développe un nœud connu. Les entrées les moins récemment
+    utilisées sont supprimées au-delà de {max_entries}.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        # (but, état) -> (distance au but, état suivant sur un chemin optimal)
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, state: AStarNode, goal: AStarNode) -> tuple[float, AStarNode or None] or None:
+        """
+        :return: La distance exacte de {state} à {goal} et l'état suivant, ou None si l'état n'est pas connu.
+        """
+        key = (goal, state)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, state: AStarNode, goal: AStarNode, distance: float, next_state: AStarNode or None) -> None:
+        key = (goal, state)
+        self.entries[key] = (distance, next_state)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def record(self, result: AStarResult) -> None:
+        """
+        Enregistre les distances de tous les nœuds d'un chemin optimal
+
+        :param result: Le résultat d'une recherche optimale (bound égal à 1, heuristique admissible)
+        """
+        path = result.path
+        goal = result.target
+        total = result.g_score[path[-1]]
+        # Du but vers la racine : si le cache déborde, ce sont les nœuds proches du but qui restent
+        self.put(goal, goal, 0, None)
+        for node, next_node in zip(reversed(path[:-1]), reversed(path[1:])):
+            self.put(node, goal, total - result.g_score[node], next_node)
+
+    def path(self, state: AStarNode, goal: AStarNode) -> list[AStarNode] or None:
+        """
+        :return: Le chemin optimal connu de {state} à {goal}, ou None s'il n'est pas (ou plus) complet dans le cache.
+        """
+        entry = self.entries.get((goal, state))
+        if entry is None:
+            return None
+
+        path = [state]
+        while path[-1] != goal:
+            entry = self.entries.get((goal, path[-1]))
+            if entry is None:  # Une partie du chemin a été supprimée
+                return None
+            path.append(entry[1])
+
+        self.hits += 1
+        self.entries.move_to_end((goal, state))
+        return path
+
+    def heuristic(self, h: Callable[[any, any], float]) -> Callable[[any, any], float]:
+        """
+        :param h: L'heuristique des nœuds qui ne sont pas dans le cache
+        :return: Une heuristique qui renvoie la distance exacte des nœuds connus, et h pour les autres.
+        """
+        entries = self.entries
+
+        def cached_h(state: AStarNode, goal: AStarNode) -> float:
+            entry = entries.get((goal, state))
+            return h(state, goal) if entry is None else entry[0]
+
+        # Pas d'attribut update : une mise à jour incrémentale partirait d'une distance exacte et non de h
+        return cached_h
+
+    def search(self, from_state: AStarNode,
+               to_state: AStarNode,
+               h: Callable[[any, any], float],
+               cost: float = 1,
+               **kwargs) -> AStarResult or None:
+        """
+        Recherche A* qui profite du cache, puis enregistre le chemin trouvé s'il est optimal
+
+        :param kwargs: Les autres paramètres de a_star_search
+        :return: Le résultat de a_star_search.
+        """
+        result = a_star_search(from_state, to_state, self.heuristic(h), cost, known_paths=self.path, **kwargs)
+        if result is not None and result.bound == 1:
+            self.record(result)
+        return result
+
+    def save(self, file_name: str) -> None:
+        """
+        Enregistre le cache dans un fichier, du moins récent au plus récent
+
+        :param file_name: Nom du fichier
+        """
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(file_name, "wb") as file:
+            pickle.dump(list(self.entries.items()), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, file_name: str, max_entries: int = 100_000) -> "DistanceCache":
+        """
+        Charge un cache enregistré par save(), ou renvoie un cache vide si le fichier n'existe pas
+
+        :param file_name: Nom du fichier
+        :param max_entries: Nombre maximal d'entrées
+        :return: Le cache.
+        """
+        cache = cls(max_entries)
+        if os.path.exists(file_name):
+            with open(file_name, "rb") as file:
+                for key, entry in pickle.load(file):
+                    cache.entries[key] = entry
+            while len(cache.entries) > max_entries:
+                cache.entries.popitem(last=False)
+        return cache
+
+
+def main():
+    # Des instances tirées autour du même but, résolues deux fois : sans puis avec le cache
+    to_state = TaquinState.from_rows([
+        [1, 2, 3],
+        [4, 5, 6],
+        [7, 8, 0]
+    ])
+
+    rng = random.Random(0)
+    instances = []
+    for _ in range(200):
+        state = to_state
+        for _ in range(rng.randint(10, 40)):
+            state = rng.choice(state.children())
+        instances.append(state)
+
+    t_start = perf_counter()
+    for from_state in instances:
+        a_star_search(from_state, to_state, manhattan)
+    print(f"Sans cache : {perf_counter() - t_start:.3f} secondes")
+
+    cache = DistanceCache.load("cache/taquin-3x3.cache")
+    t_start = perf_counter()
+    for from_state in instances:
+        cache.search(from_state, to_state, manhattan)
+    print(f"Avec cache : {perf_counter() - t_start:.3f} secondes, "
+          f"{len(cache)} distances connues, {cache.hits} recherches écourtées")
+    cache.save("cache/taquin-3x3.cache")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+import mmap
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from heapq import merge
+from time import perf_counter
+from typing import Callable, Iterator
+
+from a_star import AStarNode, AStarResult, SearchStats
+from machine import MachineState
+from taquin import TaquinState, manhattan
+
+# Nombre d'enregistrements lus ou écrits à la fois
+_BLOCK = 4096
+
+
+class Codec(ABC):
+    """
+    Sérialisation des états en enregistrements de taille fixe, pour la recherche sur disque.
+    Deux états sont égaux si et seulement si leurs encodages le sont.
+    """
+
+    size: int = 0  # Taille d'un état encodé, en octets
+
+    @abstractmethod
+    def encode(self, state: AStarNode) -> bytes:
+        """
+        :return: L'état encodé, sur {size} octets.
+        """
+
+    @abstractmethod
+    def decode(self, data: bytes) -> AStarNode:
+        """
+        :param data: Un état encodé par encode
+        :return: L'état.
+        """
+
+
+class TaquinCodec(Codec):
+    """
+    Un état du taquin est son code, en big-endian
+    """
+
+    def __init__(self, state: TaquinState):
+        self.board = state.board
+        self.size = (self.board.size * self.board.bits + 7) // 8
+
+    def encode(self, state: TaquinState) -> bytes:
+        return state.code.to_bytes(self.size, "big")
+
+    def decode(self, data: bytes) -> TaquinState:
+        code = int.from_bytes(data, "big")
+        mask = self.board.mask
+        for index, shift in enumerate(self.board.shifts):
+            if not (code >> shift) & mask:
+                return TaquinState(code, self.board, index)
+        raise ValueError("Un état du taquin doit avoir une case vide")
+
+
+class MachineCodec(Codec):
+    """
+    Un état de la machine est écrit "bras|pile|pile...", '.' représentant le bras vide, et complété par des octets nuls.
+    Les blocs doivent être des caractères ASCII.
+    """
+
+    def __init__(self, state: MachineState):
+        blocks = [block for stack in state.stacks for block in stack] + ([] if state.arm is None else [state.arm])
+        for block in blocks:
+            if len(block) != 1 or not block.isascii() or block in ".|\0":
+                raise ValueError(f"MachineCodec ne sait pas encoder le bloc {block!r}")
+
+        self.max_stacks = state.max_stacks
+        self.hint = state.hint
+        self.size = 1 + len(blocks) + state.max_stacks
+
+    def encode(self, state: MachineState) -> bytes:
+        text = (state.arm or ".") + "|".join("".join(stack) for stack in state.stacks)
+        return text.encode().ljust(self.size, b"\0")
+
+    def decode(self, data: bytes) -> MachineState:
+        text = data.rstrip(b"\0").decode()
+        arm = None if text[0] == "." else text[0]
+        stacks = [tuple(stack) for stack in text[1:].split("|")]
+        return MachineState(arm, stacks, self.max_stacks, None, self.hint)
+
+
+# Codec par défaut de chaque type d'état
+CODECS = {
+    TaquinState: TaquinCodec,
+    MachineState: MachineCodec,
+}
+
+
+def _write(file_name: str, records: list[bytes]) -> None:
+    with open(file_name, "ab") as file:
+        file.write(b"".join(records))
+
+
+def _read(file_name: str, record_size: int) -> Iterator[bytes]:
+    """
+    :return: Les enregistrements d'un fichier, lus par blocs.
+    """
+    with open(file_name, "rb") as file:
+        while data := file.read(record_size * _BLOCK):
+            for start in range(0, len(data), record_size):
+                yield data[start:start + record_size]
+
+
+def _find(file_name: str, key: bytes, record_size: int) -> bytes or None:
+    """
+    Recherche dichotomique dans un fichier trié, projeté en mémoire
+
+    :return: L'enregistrement dont l'état encodé est {key}, ou None.
+    """
+    if not os.path.exists(file_name) or os.path.getsize(file_name) == 0:
+        return None
+
+    with open(file_name, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        low, high = 0, len(data) // record_size
+        while low < high:
+            middle = (low + high) // 2
+            record = data[middle * record_size:(middle + 1) * record_size]
+            if record[:len(key)] < key:
+                low = middle + 1
+            elif record[:len(key)] > key:
+                high = middle
+            else:
+                return record
+    return None
+
+
+def external_a_star_search(from_state: AStarNode,
+                           to_state: AStarNode,
+                           h: Callable[[any, any], float],
+                           cost: float = 1,
+                           codec: Codec or None = None,
+                           directory: str or None = None,
+                           memory: int = 1_000_000,
+                           stats: SearchStats or None = None) -> AStarResult or None:
+    """
+    Recherche A* sur disque (External A*), pour les instances dont les nœuds ne tiennent pas en mémoire.
+
+    Les nœuds sont rangés dans des fichiers de seaux, un par couple (g, h), traités par f puis g croissants.
+    Les fils générés sont ajoutés sans tri au fichier de leur seau. Quand vient le tour d'un seau, son fichier
+    est trié par morceaux de {memory} enregistrements, puis les morceaux sont fusionnés : les doublons du seau
+    disparaissent, et ceux des seaux fermés (g - 1, h) et (g - 2, h) sont retirés pendant la même fusion
+    (détection différée des doublons). Le seau trié est enregistré comme fermé, et ses nœuds sont développés.
+    Chaque enregistrement contient aussi le parent, retrouvé à la fin par dichotomie dans les seaux fermés.
+
+    Les déplacements doivent être réversibles et de même coût, et h cohérente : un état réapparaît alors au plus
+    deux couches après sa couche de premier passage, et le chemin trouvé est optimal.
+
+    :param from_state: L'état initial à partir duquel commencer la recherche
+    :type from_state: AStarNode
+    :param to_state: L'état du but
+    :type to_state: AStarNode
+    :param h: la fonction heuristique, cohérente et à valeurs entières
+    :param cost: coût d'avancement dans une branche
+    :param codec: La sérialisation des états, par défaut celle de CODECS
+    :param directory: Le dossier où créer les fichiers de seaux (dans un sous-dossier supprimé à la fin),
+        par défaut le dossier temporaire du système
+    :param memory: Nombre maximal d'enregistrements gardés en mémoire (tri et tampons d'écriture)
+    :param stats: Les compteurs à remplir. duplicates compte les doublons retirés par les fusions,
+        open_peak la taille du plus grand seau
+    :return: AStarResult dont g_score, h_score et parent ne contiennent que les nœuds du chemin, visited étant vide.
+        None si aucun chemin n'existe.
+    """
+    if stats is None:
+        stats = SearchStats()
+    if not from_state.can_reach(to_state):
+        return None
+    if codec is None:
+        codec = CODECS[type(from_state)](from_state)
+
+    t_start = perf_counter()
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix="external-a-star-", dir=directory)
+
+    state_size = codec.size
+    record_size = 2 * state_size  # État, puis parent
+    goal = codec.encode(to_state)
+    update = getattr(h, "update", None)
+
+    def open_file(key: tuple) -> str:
+        return os.path.join(directory, f"open-{key[0]}-{key[1]}")
+
+    def closed_file(key: tuple) -> str:
+        return os.path.join(directory, f"closed-{key[0]}-{key[1]}")
+
+    # Seaux qui attendent d'être traités, et enregistrements pas encore écrits de chacun
+    waiting: set[tuple] = set()
+    pending: {tuple: list[bytes]} = {}
+    pending_count = 0
+    closed: {int: set} = {}  # h des seaux fermés de chaque couche
+
+    def add(key: tuple, record: bytes) -> None:
+        nonlocal pending_count
+        if key[1] != int(key[1]):
+            raise ValueError("L'heuristique doit être à valeurs entières")
+        key = (key[0], int(key[1]))
+        if key[1] in closed.get(key[0], ()):
+            raise ValueError("L'heuristique n'est pas cohérente : un fils arrive dans un seau déjà fermé")
+        waiting.add(key)
+        pending.setdefault(key, []).append(record)
+        pending_count += 1
+        if pending_count >= memory:
+            flush()
+
+    def flush() -> None:
+        nonlocal pending_count
+        for pending_key, records in pending.items():
+            _write(open_file(pending_key), records)
+        pending.clear()
+        pending_count = 0
+
+    def sorted_bucket(key: tuple) -> Iterator[bytes]:
+        # Tri externe : morceaux triés en mémoire, puis fusion des morceaux
+        if key in pending:
+            _write(open_file(key), pending.pop(key))
+
+        runs = []
+        chunk = []
+        for record in _read(open_file(key), record_size):
+            chunk.append(record)
+            if len(chunk) >= memory:
+                runs.append(write_run(chunk, len(runs)))
+                chunk = []
+        os.remove(open_file(key))
+
+        if not runs:
+            chunk.sort()
+            yield from chunk
+            return
+        if chunk:
+            runs.append(write_run(chunk, len(runs)))
+        try:
+            yield from merge(*(_read(run, record_size) for run in runs))
+        finally:
+            for run in runs:
+                os.remove(run)
+
+    def write_run(chunk: list[bytes], number: int) -> str:
+        run = os.path.join(directory, f"run-{number}")
+        chunk.sort()
+        _write(run, chunk)
+        return run
+
+    def earlier(key: tuple) -> list[Iterator[bytes]]:
+        # Seaux fermés où un doublon peut se trouver
+        g, h_value = key
+        return [_read(closed_file((layer, h_value)), record_size)
+                for layer in (g - 1, g - 2) if h_value in closed.get(layer, ())]
+
+    def backtrack(record: bytes, g: int, h_value: float) -> tuple[list[bytes], list[float]]:
+        # Le parent d'un nœud de la couche g est dans l'un des seaux fermés de la couche g - 1
+        path = [record[:state_size]]
+        h_path = [h_value]
+        while g > 0:
+            parent = record[state_size:]
+            g -= 1
+            for h_value in closed[g]:
+                record = _find(closed_file((g, h_value)), parent, record_size)
+                if record is not None:
+                    break
+            path.append(parent)
+            h_path.append(h_value)
+        path.reverse()
+        h_path.reverse()
+        return path, h_path
+
+    try:
+        h_root = h(from_state, to_state)
+        stats.heuristic_calls += 1
+        root = codec.encode(from_state)
+        add((0, h_root), root + root)  # La racine est son propre parent
+
+        while waiting:
+            key = min(waiting, key=lambda bucket: (bucket[0] + bucket[1], bucket[0]))
+            waiting.remove(key)
+            g, h_value = key
+
+            # Fusion du seau trié avec les seaux fermés précédents
+            previous = [[iterator, next(iterator, None)] for iterator in earlier(key)]
+            closed.setdefault(g, set()).add(h_value)
+            last = None
+            bucket_size = 0
+            found = None
+
+            with open(closed_file(key), "wb") as output:
+                for record in sorted_bucket(key):
+                    state = record[:state_size]
+                    if state == last:
+                        stats.duplicates += 1
+                        continue
+                    last = state
+
+                    duplicate = False
+                    for entry in previous:
+                        while entry[1] is not None and entry[1][:state_size] < state:
+                            entry[1] = next(entry[0], None)
+                        if entry[1] is not None and entry[1][:state_size] == state:
+                            duplicate = True
+                    if duplicate:
+                        stats.duplicates += 1
+                        continue
+
+                    output.write(record)
+                    bucket_size += 1
+                    if state == goal:
+                        found = record
+                        break
+
+                    # Développement du nœud
+                    stats.expansions += 1
+                    current = codec.decode(state)
+                    t_successor = perf_counter()
+                    children = current.children()
+                    stats.successor_time += perf_counter() - t_successor
+
+                    for child in children:
+                        encoded = codec.encode(child)
+                        if encoded == state or encoded == record[state_size:]:  # Retour immédiat au parent
+                            continue
+                        stats.generations += 1
+                        t_heuristic = perf_counter()
+                        if update is not None:
+                            h_child = update(current, child, to_state, h_value)
+                        else:
+                            h_child = h(child, to_state)
+                        stats.heuristic_time += perf_counter() - t_heuristic
+                        stats.heuristic_calls += 1
+                        add((g + 1, h_child), encoded + state)
+
+            stats.open_peak = max(stats.open_peak, bucket_size)
+
+            if found is not None:
+                path, h_path = backtrack(found, g, h_value)
+                stats.total_time += perf_counter() - t_start
+                path_states = [codec.decode(state) for state in path]
+                return AStarResult(
+                    from_state,
+                    to_state,
+                    path_states,
+                    {state: i * cost for i, state in enumerate(path_states)},
+                    dict(zip(path_states, h_path)),
+                    {state: path_states[i] for i, state in enumerate(path_states[1:])},
+                    {},
+                    stats.generations,
+                    stats,
+                )
+
+        stats.total_time += perf_counter() - t_start
+        return None
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    from_state = TaquinState.from_rows([
+        [12, 1, 3, 4],
+        [2, 13, 14, 5],
+        [11, 10, 8, 6],
+        [9, 15, 7, 0]
+    ])
+    to_state = TaquinState.from_rows([
+        [2, 12, 3, 4],
+        [1, 13, 0, 5],
+        [11, 14, 7, 8],
+        [10, 9, 15, 6]
+    ])
+
+    stats = SearchStats()
+    result = external_a_star_search(from_state, to_state, manhattan, memory=10_000, stats=stats)
+    print(f"Chemin de {len(result.path) - 1} coups, {stats.expansions} nœuds développés, "
+          f"{stats.duplicates} doublons retirés, plus grand seau : {stats.open_peak} nœuds, "
+          f"{stats.total_time:.2f} secondes")
+
+
+if __name__ == '__main__':
+    main()
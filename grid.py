@@ -0,0 +1,290 @@
+import math
+import random
+from functools import partial
+from time import perf_counter
+
+from a_star import AStarResult, SearchStats, a_star_search
+from utils import require_numpy
+
+# Valeur d'une case libre dans la carte, toute autre valeur est un obstacle
+FREE = 0
+WALL = 1
+
+_SQRT2 = math.sqrt(2)
+
+
+class Grid:
+    """
+    Carte d'occupation 2D pour la recherche de chemin.
+
+    Les cases sont rangées ligne par ligne dans un bytearray entouré d'un bord d'obstacles : un voisin
+    s'obtient par un simple décalage d'index, sans test de bord. Les nœuds de la recherche sont les index
+    (entiers) des cases dans ce tableau, voir index() et coords().
+    """
+
+    def __init__(self, width: int, height: int, cells: bytes or bytearray, diagonal: bool = False):
+        """
+        :param width: Nombre de colonnes
+        :param height: Nombre de lignes
+        :param cells: width * height octets, ligne par ligne, FREE pour une case libre
+        :param diagonal: 8-connexité (déplacements en diagonale de coût √2, sans couper les coins) au lieu de 4
+        """
+        if len(cells) != width * height:
+            raise ValueError(f"La carte doit avoir {width * height} cases, et non {len(cells)}")
+
+        self.width = width
+        self.height = height
+        self.diagonal = diagonal
+        self.stride = width + 2  # Longueur d'une ligne, bords compris
+
+        self.cells = bytearray([WALL]) * (self.stride * (height + 2))
+        for y in range(height):
+            start = (y + 1) * self.stride + 1
+            self.cells[start:start + width] = cells[y * width:(y + 1) * width]
+
+        # Décalage d'index de chaque direction, et sa décomposition (dx, décalage vertical)
+        self.straight = (1, -self.stride, -1, self.stride)
+        self.diagonals = ((1, -self.stride), (-1, -self.stride), (-1, self.stride), (1, self.stride))
+        self.directions = {dx + dy: (dx, dy) for dx in (-1, 0, 1) for dy in (-self.stride, 0, self.stride)}
+
+    @classmethod
+    def from_lines(cls, lines: list[str], diagonal: bool = False) -> "Grid":
+        """
+        :param lines: Les lignes de la carte, '#' pour un obstacle et n'importe quel autre caractère sinon
+        :return: La carte.
+        """
+        cells = bytes(WALL if char == "#" else FREE for line in lines for char in line)
+        return cls(len(lines[0]), len(lines), cells, diagonal)
+
+    @classmethod
+    def from_array(cls, array, diagonal: bool = False) -> "Grid":
+        """
+        :param array: Un tableau numpy (hauteur, largeur), 0 pour une case libre
+        :return: La carte.
+        """
+        np = require_numpy()
+        array = np.asarray(array)
+        height, width = array.shape
+        return cls(width, height, (array != 0).astype(np.uint8).tobytes(), diagonal)
+
+    @classmethod
+    def random(cls, width: int, height: int, density: float, seed: int = 0, diagonal: bool = False) -> "Grid":
+        """
+        :param density: Proportion d'obstacles
+        :return: Une carte aléatoire, qui ne dépend que de la graine.
+        """
+        rng = random.Random(seed)
+        cells = bytes(WALL if rng.random() < density else FREE for _ in range(width * height))
+        return cls(width, height, cells, diagonal)
+
+    def index(self, x: int, y: int) -> int:
+        """
+        :return: Le nœud de la case (x, y).
+        """
+        return (y + 1) * self.stride + x + 1
+
+    def coords(self, node: int) -> tuple[int, int]:
+        """
+        :return: Les coordonnées (x, y) d'un nœud.
+        """
+        y, x = divmod(node, self.stride)
+        return x - 1, y - 1
+
+    def is_free(self, node: int) -> bool:
+        return self.cells[node] == FREE
+
+    def neighbours(self, node: int, _=None) -> list[tuple[int, float]]:
+        """
+        Génération des fils pour a_star_search (le parent n'est pas utilisé)
+
+        :return: Les couples (case voisine libre, coût du déplacement).
+        """
+        cells = self.cells
+        res = [(node + offset, 1) for offset in self.straight if cells[node + offset] == FREE]
+
+        if self.diagonal:
+            for dx, dy in self.diagonals:
+                # Sans couper les coins : les deux cases orthogonales doivent être libres
+                if cells[node + dx] == FREE and cells[node + dy] == FREE and cells[node + dx + dy] == FREE:
+                    res.append((node + dx + dy, _SQRT2))
+
+        return res
+
+    def distance(self, node: int, target: int) -> float:
+        """
+        Heuristique : distance octile en 8-connexité, distance de manhattan en 4-connexité.
+        Elle est exacte sur une carte sans obstacle.
+        """
+        y, x = divmod(node, self.stride)
+        target_y, target_x = divmod(target, self.stride)
+        dx = abs(x - target_x)
+        dy = abs(y - target_y)
+        if self.diagonal:
+            return dx + dy + (_SQRT2 - 2) * min(dx, dy)
+        return dx + dy
+
+    def _jump(self, node: int, dx: int, dy: int, goal: int) -> int or None:
+        """
+        Avance depuis {node} dans la direction (dx, dy) jusqu'au prochain point de saut
+
+        :param dx: -1, 0 ou 1
+        :param dy: Le décalage vertical : -stride, 0 ou stride
+        :return: Le point de saut, ou None si on atteint un obstacle avant.
+        """
+        cells = self.cells
+        stride = self.stride
+
+        while True:
+            if cells[node] != FREE:
+                return None
+            if node == goal:
+                return node
+
+            if dx and dy:
+                # En diagonale, on s'arrête si l'un des deux déplacements droits trouve un point de saut
+                if self._jump(node + dx, dx, 0, goal) is not None or self._jump(node + dy, 0, dy, goal) is not None:
+                    return node
+            elif dx:
+                # Voisin forcé : une case libre en haut ou en bas, derrière laquelle il y a un obstacle
+                if (cells[node - stride] == FREE and cells[node - dx - stride] != FREE) \
+                        or (cells[node + stride] == FREE and cells[node - dx + stride] != FREE):
+                    return node
+            else:
+                if (cells[node - 1] == FREE and cells[node - 1 - dy] != FREE) \
+                        or (cells[node + 1] == FREE and cells[node + 1 - dy] != FREE):
+                    return node
+
+            # Sans couper les coins (en ligne droite, le second test porte sur la case actuelle)
+            if cells[node + dx] == FREE and cells[node + dy] == FREE:
+                node += dx + dy
+            else:
+                return None
+
+    def jump_successors(self, node: int, parent: int or None, goal: int) -> list[tuple[int, float]]:
+        """
+        Génération des fils de Jump Point Search : seules les directions qui ne sont pas dominées par un chemin
+        passant par le parent sont explorées, et chacune est suivie jusqu'au prochain point de saut.
+
+        :return: Les couples (point de saut, distance depuis {node}).
+        """
+        cells = self.cells
+        stride = self.stride
+
+        if parent is None:
+            directions = [self.directions[child - node] for child, _ in self.neighbours(node)]
+        else:
+            y, x = divmod(node, stride)
+            parent_y, parent_x = divmod(parent, stride)
+            dx = (x > parent_x) - (x < parent_x)
+            dy = ((y > parent_y) - (y < parent_y)) * stride
+
+            directions = []
+            if dx and dy:
+                if cells[node + dy] == FREE:
+                    directions.append((0, dy))
+                if cells[node + dx] == FREE:
+                    directions.append((dx, 0))
+                if cells[node + dy] == FREE and cells[node + dx] == FREE:
+                    directions.append((dx, dy))
+            elif dx:
+                up = cells[node - stride] == FREE
+                down = cells[node + stride] == FREE
+                if cells[node + dx] == FREE:
+                    directions.append((dx, 0))
+                    if up:
+                        directions.append((dx, -stride))
+                    if down:
+                        directions.append((dx, stride))
+                if up:
+                    directions.append((0, -stride))
+                if down:
+                    directions.append((0, stride))
+            else:
+                left = cells[node - 1] == FREE
+                right = cells[node + 1] == FREE
+                if cells[node + dy] == FREE:
+                    directions.append((0, dy))
+                    if right:
+                        directions.append((1, dy))
+                    if left:
+                        directions.append((-1, dy))
+                if right:
+                    directions.append((1, 0))
+                if left:
+                    directions.append((-1, 0))
+
+        res = []
+        for dx, dy in directions:
+            jump_point = self._jump(node + dx + dy, dx, dy, goal)
+            if jump_point is not None:
+                res.append((jump_point, self.distance(node, jump_point)))
+        return res
+
+    def search(self, start: int, goal: int, jps: bool = False, **kwargs) -> AStarResult or None:
+        """
+        Recherche A* sur la carte, avec la distance octile (ou de manhattan) comme heuristique
+
+        :param start: Le nœud de départ (voir index)
+        :param goal: Le nœud d'arrivée
+        :param jps: Jump Point Search, en 8-connexité seulement. Le chemin ne contient alors que les points de saut,
+            voir expand_path
+        :param kwargs: Les autres paramètres de a_star_search
+        :return: Le résultat de a_star_search, g_score[goal] étant la longueur du chemin.
+        """
+        if jps and not self.diagonal:
+            raise ValueError("Jump Point Search n'est disponible qu'en 8-connexité")
+        if not self.is_free(start) or not self.is_free(goal):
+            return None
+
+        successors = partial(self.jump_successors, goal=goal) if jps else self.neighbours
+        return a_star_search(start, goal, self.distance, successors=successors, **kwargs)
+
+    def expand_path(self, path: list[int]) -> list[int]:
+        """
+        :param path: Un chemin de points de saut, reliés en ligne droite ou en diagonale
+        :return: Le chemin case par case.
+        """
+        res = path[:1]
+        for node in path[1:]:
+            y, x = divmod(node, self.stride)
+            previous_y, previous_x = divmod(res[-1], self.stride)
+            step = (x > previous_x) - (x < previous_x) + ((y > previous_y) - (y < previous_y)) * self.stride
+            while res[-1] != node:
+                res.append(res[-1] + step)
+        return res
+
+    def render(self, path: list[int] = ()) -> str:
+        """
+        :return: La carte en texte, '#' pour un obstacle et '*' pour une case du chemin.
+        """
+        on_path = set(self.expand_path(list(path))) if path else set()
+        lines = []
+        for y in range(self.height):
+            line = []
+            for x in range(self.width):
+                node = self.index(x, y)
+                line.append("*" if node in on_path else "." if self.is_free(node) else "#")
+            lines.append("".join(line))
+        return "\n".join(lines)
+
+
+def main():
+    grid = Grid.random(1000, 1000, 0.25, seed=0, diagonal=True)
+    start = grid.index(0, 0)
+    goal = grid.index(grid.width - 1, grid.height - 1)
+    grid.cells[start] = grid.cells[goal] = FREE
+
+    for name, jps in (("A*", False), ("JPS", True)):
+        stats = SearchStats()
+        t_start = perf_counter()
+        result = grid.search(start, goal, jps=jps, stats=stats)
+        elapsed = perf_counter() - t_start
+        if result is None:
+            print(f"{name} : aucun chemin")
+        else:
+            print(f"{name} : longueur {result.g_score[goal]:.2f}, {stats.expansions} nœuds développés, "
+                  f"{elapsed:.2f} secondes")
+
+
+if __name__ == '__main__':
+    main()
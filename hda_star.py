@@ -0,0 +1,231 @@
+import multiprocessing
+from queue import Empty
+from time import sleep
+from typing import Callable
+
+from a_star import AStarNode, AStarResult, OpenList
+
+# Nombre de nœuds développés par un processus entre deux envois / lectures de messages
+_EXPANSIONS_PER_ROUND = 64
+
+# Multiplicateur de Fibonacci, pour mélanger les bits du hash avant de choisir le propriétaire d'un nœud
+_MIX = 0x9E3779B97F4A7C15
+_MASK = (1 << 64) - 1
+
+
+def owner(node: AStarNode, workers: int) -> int:
+    """
+    :param node: Un nœud
+    :param workers: Le nombre de processus
+    :return: L'index du processus qui possède le nœud.
+    """
+    return (((hash(node) & _MASK) * _MIX & _MASK) >> 32) % workers
+
+
+def _worker(index: int,
+            workers: int,
+            inboxes: list,
+            results,
+            from_state: AStarNode,
+            to_state: AStarNode,
+            h: Callable[[any, any], float],
+            cost: float,
+            incumbent,
+            sent,
+            received,
+            idle) -> None:
+    """
+    Boucle d'un processus de recherche : il possède les nœuds dont owner(node) == index,
+    avec leurs listes ouverte et fermée, et reçoit de ses voisins les nœuds qu'ils ont générés.
+
+    Messages reçus dans inboxes[index] :
+        - ("nodes", [(node, g, parent), ...]) : des nœuds générés par les autres processus
+        - ("parent", node) : demande du parent d'un nœud, répondu dans results
+        - ("stop",) : fin de la recherche, le processus renvoie ses compteurs dans results
+    """
+    g_score: {AStarNode: float} = {}
+    h_score: {AStarNode: float} = {}
+    parent: {AStarNode: AStarNode or None} = {}
+    visited = set()
+    open_list = OpenList()
+    outgoing = [[] for _ in range(workers)]
+    steps = 0
+
+    def add(node: AStarNode, g: float, node_parent: AStarNode or None) -> None:
+        if node not in g_score or g < g_score[node]:
+            if node not in h_score:
+                h_score[node] = h(node, to_state)
+            g_score[node] = g
+            parent[node] = node_parent
+            open_list.push(node, g + h_score[node], h_score[node])
+
+    if owner(from_state, workers) == index:
+        add(from_state, 0, None)
+
+    inbox = inboxes[index]
+    while True:
+        has_work = bool(open_list) and open_list.min_f() < incumbent.value
+        if has_work:
+            idle[index] = 0
+
+        # Lecture des messages, en attendant un peu si on n'a rien d'autre à faire
+        try:
+            message = inbox.get_nowait() if has_work else inbox.get(timeout=0.01)
+        except Empty:
+            message = None
+
+        while message is not None:
+            # Pour la détection de terminaison, on n'est plus inactif avant de compter le message comme reçu
+            idle[index] = 0
+            received[index] += 1
+
+            if message[0] == "nodes":
+                for node, g, node_parent in message[1]:
+                    add(node, g, node_parent)
+            elif message[0] == "parent":
+                results.put(("parent", parent.get(message[1])))
+            elif message[0] == "stop":
+                results.put(("stats", steps, len(visited)))
+                return
+
+            try:
+                message = inbox.get_nowait()
+            except Empty:
+                message = None
+
+        # Développement d'un paquet de nœuds
+        for _ in range(_EXPANSIONS_PER_ROUND):
+            if not open_list or open_list.min_f() >= incumbent.value:
+                break
+
+            current = open_list.pop()
+            visited.add(current)
+            g_current = g_score[current]
+
+            if current == to_state:
+                # Seul le propriétaire du but écrit la meilleure solution
+                if g_current < incumbent.value:
+                    incumbent.value = g_current
+                continue
+
+            for child in current.children():
+                if child == current:
+                    continue
+
+                steps += 1
+                child_owner = owner(child, workers)
+                if child_owner == index:
+                    add(child, g_current + cost, current)
+                else:
+                    outgoing[child_owner].append((child, g_current + cost, current))
+
+        # Envoi des nœuds générés à leurs propriétaires
+        for i, nodes in enumerate(outgoing):
+            if nodes:
+                sent[index] += 1  # Compté avant l'envoi, pour ne jamais avoir reçu > envoyé
+                inboxes[i].put(("nodes", nodes))
+                outgoing[i] = []
+
+        if not open_list or open_list.min_f() >= incumbent.value:
+            idle[index] = 1
+
+
+def hda_star_search(from_state: AStarNode,
+                    to_state: AStarNode,
+                    h: Callable[[any, any], float],
+                    cost: float = 1,
+                    workers: int or None = None) -> AStarResult or None:
+    """
+    Réalise une recherche A* parallèle à distribution par hash (HDA*).
+
+    Chaque nœud appartient au processus owner(node) qui garde ses listes ouverte et fermée.
+    Les nœuds générés sont envoyés par paquets à leur propriétaire. La recherche s'arrête quand tous les processus
+    n'ont plus de nœud ouvert de f inférieur à la meilleure solution trouvée, et qu'aucun message n'est en transit.
+
+    Les processus sont créés par fork : les états et l'heuristique n'ont pas besoin d'être sérialisables
+    au démarrage, seuls les états le sont pour circuler entre processus.
+
+    :param from_state: L'état initial à partir duquel commencer la recherche
+    :type from_state: AStarNode
+    :param to_state: L'état du but
+    :type to_state: AStarNode
+    :param h: la fonction heuristique
+    :param cost: coût d'avancement dans une branche
+    :param workers: Nombre de processus, par défaut le nombre de cœurs
+    :return: AStarResult dont g_score, h_score, parent et visited ne contiennent que les nœuds du chemin,
+        steps étant le nombre total de nœuds générés par tous les processus.
+    """
+    if not from_state.can_reach(to_state):
+        return None
+
+    context = multiprocessing.get_context("fork")
+    if workers is None:
+        workers = context.cpu_count()
+
+    inboxes = [context.Queue() for _ in range(workers)]
+    results = context.Queue()
+
+    incumbent = context.Value("d", float("inf"), lock=False)  # Coût de la meilleure solution trouvée
+    sent = context.Array("q", workers, lock=False)  # Nombre de paquets envoyés par chaque processus
+    received = context.Array("q", workers, lock=False)  # Nombre de messages reçus par chaque processus
+    idle = context.Array("b", [0] * workers, lock=False)
+
+    processes = [
+        context.Process(target=_worker,
+                        args=(i, workers, inboxes, results, from_state, to_state, h, cost,
+                              incumbent, sent, received, idle),
+                        daemon=True)
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        # Détection de terminaison : deux relevés successifs identiques, tous inactifs,
+        # et autant de paquets reçus qu'envoyés (les compteurs ne font qu'augmenter)
+        previous = None
+        while True:
+            sleep(0.005)
+            snapshot = (all(idle), sum(sent), sum(received))
+            if snapshot == previous and snapshot[0] and snapshot[1] == snapshot[2]:
+                break
+            previous = snapshot
+
+        if incumbent.value == float("inf"):
+            path = None
+        else:
+            # On remonte le chemin en demandant son parent au propriétaire de chaque nœud
+            path = [to_state]
+            while True:
+                inboxes[owner(path[-1], workers)].put(("parent", path[-1]))
+                _, node_parent = results.get()
+                if node_parent is None:
+                    break
+                path.append(node_parent)
+            path.reverse()
+
+        steps = 0
+        for inbox in inboxes:
+            inbox.put(("stop",))
+        for _ in processes:
+            _, worker_steps, _ = results.get()
+            steps += worker_steps
+    finally:
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+    if path is None:
+        return None
+
+    return AStarResult(
+        from_state,
+        to_state,
+        path,
+        {node: i * cost for i, node in enumerate(path)},
+        {node: h(node, to_state) for node in path},
+        {node: path[i] for i, node in enumerate(path[1:])},
+        {node: i for i, node in enumerate(path)},
+        steps
+    )
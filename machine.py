@@ -1,19 +1,60 @@
 from dataclasses import dataclass, field
 
-from a_star import AStarNode, AStarResult, def_node_attr, wrap_search
-from utils import ife, deepcopy2d
+from a_star import AStarNode, AStarResult, batched, def_node_attr, incremental, wrap_search
+from utils import ife, require_numpy
+
+# Support d'un bloc posé sur la table
+TABLE = ""
 
 
 @dataclass(frozen=True)  # Le nombre d'étapes change aussi selon l'ordre.
 class MachineState(AStarNode):
     arm: str or None
-    stacks: list[list[str]] = field(hash=False)
+    # Forme canonique : les piles non vides triées, suivies des piles vides.
+    # Deux états qui ne diffèrent que par l'ordre des piles sont donc égaux.
+    stacks: tuple[tuple[str, ...], ...]
     max_stacks: int
+    _hash: int = field(init=False, repr=False, compare=False)
+    # Support du bloc porté au moment où on l'a pris (TABLE pour la table), None si inconnu :
+    # on ne génère pas le mouvement qui le repose au même endroit
+    picked_from: str or None = field(default=None, repr=False, compare=False)
+    # Support final de chaque bloc (voir supports), pour générer d'abord le mouvement qui pose le bloc à sa place
+    hint: dict or None = field(default=None, repr=False, compare=False)
 
     def __post_init__(self):
-        # On remplit les piles avec des listes vides au besoin
-        for i in range(self.max_stacks - len(self.stacks)):
-            self.stacks.append([])
+        stacks = sorted(tuple(stack) for stack in self.stacks if stack)
+        # On remplit les piles avec des piles vides au besoin
+        stacks = tuple(stacks) + ((),) * (self.max_stacks - len(stacks))
+
+        object.__setattr__(self, "stacks", stacks)
+        object.__setattr__(self, "_hash", hash((self.arm, stacks)))
+
+    def __eq__(self, other):
+        return self._hash == other._hash and self.arm == other.arm and self.stacks == other.stacks
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # Le hash d'une chaîne change d'un processus à l'autre : il est recalculé à la désérialisation
+        return MachineState, (self.arm, self.stacks, self.max_stacks, self.picked_from, self.hint)
+
+    def supports(self) -> {str: str}:
+        """
+        :return: Le support de chaque bloc des piles : le bloc juste en dessous, ou TABLE.
+        """
+        supports = {}
+        for stack in self.stacks:
+            for i, block in enumerate(stack):
+                supports[block] = stack[i + 1] if i + 1 < len(stack) else TABLE
+        return supports
+
+    def with_hint(self, goal: "MachineState") -> "MachineState":
+        """
+        :param goal: L'état but
+        :return: Le même état, dont les descendants essaieront d'abord de poser le bloc porté sur son support final.
+        """
+        return MachineState(self.arm, self.stacks, self.max_stacks, self.picked_from, goal.supports())
 
     @property
     def size(self):
@@ -32,16 +73,6 @@ class MachineState(AStarNode):
 
         return free_blocks
 
-    def __eq__(self, other):
-        if self.arm != other.arm:
-            return False
-
-        for stack in self.stacks:
-            if stack not in other.stacks:
-                return False
-
-        return True
-
     def is_above(self, first: str, second: str or None) -> bool:
         """
         :param first: La lettre que nous cherchons
@@ -97,44 +128,86 @@ class MachineState(AStarNode):
 
         return False
 
-    def children(self) -> list:
-        """
-        Construit la liste des nœuds fils du nœud actuel
+    def key(self) -> str:
+        return _key(self.arm, self.stacks)
 
-        :return: Une liste d'états.
+    def _moves(self) -> list[int]:
         """
-
-        children = []
+        :return: Les déplacements vers les fils, dans l'ordre de children() : l'index de la pile où l'on prend
+            le bloc si le bras est libre, sinon l'index de la pile où l'on pose le bloc porté.
+        """
+        moves = []
 
         # Si le bras est libre, on essaie de porter un element en tête de file
         if self.arm is None:
+            for i, stack in enumerate(self.stacks):
+                if stack:
+                    moves.append(i)
+
+        else:  # Sinon, on essaie de poser sur une tête de file, ou dans une nouvelle file
+            goal_support = None if self.hint is None else self.hint.get(self.arm)
 
-            # Pour tous les blocs libres, on créé un état qui porte ce bloc
-            for free_block in self.get_free_blocks():
-                new_stacks = deepcopy2d(self.stacks)
+            for i, stack in enumerate(self.stacks):
+                support = stack[0] if stack else TABLE
 
-                for stack in new_stacks:  # On retire le bloc concerné dans nos listes
-                    if free_block in stack:
-                        stack.remove(free_block)
-                        break
+                # Reposer le bloc là où on vient de le prendre ramènerait à l'état précédent
+                if support != self.picked_from:
+                    if support == goal_support:
+                        moves.insert(0, i)
+                    else:
+                        moves.append(i)
 
-                state = MachineState(free_block, new_stacks, self.max_stacks)
+                # Les piles vides sont en fin de liste et sont toutes équivalentes :
+                # poser le bloc sur l'une ou l'autre donne le même état
+                if not stack:
+                    break
 
-                children.append(state)
+        return moves
 
-        else:  # Sinon, on essaie de poser sur une tête de file, ou dans une nouvelle file
-            for i in range(self.max_stacks):
-                new_stacks = deepcopy2d(self.stacks)
-                # On ajoute le bloc qu'on porte à la tête de la i-ème file
-                # Si la file est vide cela correspondra à un bloc posé sur la table
+    def _child_stacks(self, move: int) -> tuple[tuple[str, ...], ...]:
+        stack = self.stacks[move]
+        # On retire le bloc en tête de la pile, ou on ajoute le bloc porté à sa tête
+        # (si la file est vide cela correspondra à un bloc posé sur la table)
+        new_stack = stack[1:] if self.arm is None else (self.arm,) + stack
+        return self.stacks[:move] + (new_stack,) + self.stacks[move + 1:]
+
+    def children(self) -> list:
+        """
+        Construit la liste des nœuds fils du nœud actuel
+
+        :return: Une liste d'états.
+        """
+        return [self.apply(move) for move in self._moves()]
+
+    def moves(self) -> list:
+        """
+        Génération paresseuse des fils : la clé de chaque fils est calculée sans construire l'état
 
-                new_stacks[i].insert(0, self.arm)
+        :return: Les couples (clé du fils, index de la pile, voir _moves).
+        """
+        res = []
+        for move in self._moves():
+            child_arm = self.stacks[move][0] if self.arm is None else None
+            res.append((_key(child_arm, sorted(self._child_stacks(move))), move))
+        return res
+
+    def apply(self, move: int) -> "MachineState":
+        if self.arm is None:
+            # On retient ce qu'il y avait sous le bloc pris
+            stack = self.stacks[move]
+            support = stack[1] if len(stack) > 1 else TABLE
+            return MachineState(stack[0], self._child_stacks(move), self.max_stacks, support, self.hint)
+        return MachineState(None, self._child_stacks(move), self.max_stacks, None, self.hint)
 
-                state = MachineState(None, new_stacks, self.max_stacks)
 
-                children.append(state)
+def _key(arm: str or None, stacks) -> str:
+    """
+    Clé compacte d'un état (voir AStarNode.key) : le bloc porté puis les piles non vides, dans l'ordre canonique
 
-        return children
+    :param stacks: Les piles, triées
+    :return: Une chaîne, les blocs étant séparés par \\x1f et les piles par \\x1e.
+    """
+    return "\x1e".join(["" if arm is None else arm] + ["\x1f".join(stack) for stack in stacks if stack])
 
 
 def render_node(node: MachineState, result: AStarResult) -> str:
@@ -166,18 +239,141 @@ def render_node(node: MachineState, result: AStarResult) -> str:
     return "\n".join(lines)
 
 
+def above_heuristic(base: float, terms: list[tuple[str, str or None, float]]):
+    """
+    Construit l'heuristique base - sum(ife(state.is_above(first, second)) * weight)
+
+    Un mouvement ne change que le support du bloc déplacé (celui qui est dans le bras avant ou après),
+    la mise à jour incrémentale ne réévalue donc que les termes qui portent sur ce bloc.
+    L'évaluation groupée (numpy) code chaque état par le support de chaque bloc, puis compare ces supports
+    à ceux des termes pour tous les états à la fois.
+
+    :param base: La valeur de l'heuristique quand aucun terme n'est vérifié
+    :param terms: Les triplets (first, second, weight)
+    :return: L'heuristique, avec sa mise à jour incrémentale.
+    """
+    terms_by_block = {}
+    for first, second, weight in terms:
+        terms_by_block.setdefault(first, []).append((second, weight))
+
+    def update(parent: MachineState, child: MachineState, _, h_parent: float) -> float:
+        block = child.arm if child.arm is not None else parent.arm
+
+        res = h_parent
+        for second, weight in terms_by_block.get(block, []):
+            res += ife(parent.is_above(block, second)) * weight
+            res -= ife(child.is_above(block, second)) * weight
+        return res
+
+    # Numéro de chaque bloc des termes, puis deux supports particuliers : la table et « ailleurs » (bras, autre bloc)
+    blocks = {}
+    for first, second, _ in terms:
+        for block in (first, second):
+            if block is not None and block not in blocks:
+                blocks[block] = len(blocks)
+    table = len(blocks)
+    elsewhere = len(blocks) + 1
+    arrays = []  # (premiers blocs, supports attendus, poids), construits au premier appel
+
+    def batch(states: list[MachineState], _) -> list[float]:
+        np = require_numpy()
+        if not arrays:
+            arrays.append(np.array([blocks[first] for first, _, _ in terms], dtype=np.intp))
+            arrays.append(np.array([table if second is None else blocks[second] for _, second, _ in terms]))
+            arrays.append(np.array([weight for _, _, weight in terms], dtype=float))
+        firsts, seconds, weights = arrays
+
+        # below[i][b] : le support du bloc b dans le i-ème état
+        below = []
+        for state in states:
+            row = [elsewhere] * len(blocks)
+            for stack in state.stacks:
+                for i, block in enumerate(stack):
+                    if block in blocks:
+                        row[blocks[block]] = blocks.get(stack[i + 1], elsewhere) if i + 1 < len(stack) else table
+            below.append(row)
+
+        # ife vaut 1 pour un terme vérifié et -1 sinon
+        placed = np.where(np.array(below)[:, firsts] == seconds, 1, -1)
+        return (base - placed @ weights).tolist()
+
+    @batched(batch)
+    @incremental(update)
+    def heuristic(state: MachineState, _) -> float:
+        res = base
+        for first, second, weight in terms:
+            res -= ife(state.is_above(first, second)) * weight
+        return res
+
+    return heuristic
+
+
+def goal_heuristic(goal: MachineState):
+    """
+    Construit une heuristique admissible à partir de l'état but, sans poids à choisir.
+
+    Un bloc est bien placé si son support est son support final et que tout ce qui est en dessous est bien placé.
+    Un bloc mal placé doit être pris puis posé au moins une fois (2 mouvements), un bloc déjà dans le bras
+    doit être posé (1 mouvement), et le bloc que le but met dans le bras doit être pris s'il ne l'est pas encore.
+    Chaque mouvement ne déplace qu'un bloc : la somme ne surestime jamais le nombre de mouvements restants.
+
+    :param goal: L'état but. L'heuristique se sert du but qu'on lui donne (la recherche arrière de
+        bidirectional_a_star_search l'appelle avec l'état initial) : celui-ci est seulement préparé à l'avance.
+    :return: L'heuristique, avec sa mise à jour incrémentale.
+    """
+    # Supports finaux et bloc porté de chaque but rencontré
+    targets = {goal: (goal.supports(), goal.arm)}
+
+    def target_of(target: MachineState) -> tuple[{str: str}, str or None]:
+        entry = targets.get(target)
+        if entry is None:
+            entry = targets[target] = (target.supports(), target.arm)
+        return entry
+
+    def block_cost(state: MachineState, block: str, supports: {str: str}, goal_arm: str or None) -> int:
+        if state.arm == block:
+            return 0 if block == goal_arm else 1
+
+        for stack in state.stacks:
+            if block in stack:
+                # Le bloc et tout ce qui est en dessous doivent reposer sur leur support final
+                for i in range(stack.index(block), len(stack)):
+                    support = stack[i + 1] if i + 1 < len(stack) else TABLE
+                    if supports.get(stack[i]) != support:
+                        # Le bloc mal placé doit seulement être pris si c'est celui que le but met dans le bras
+                        return 1 if block == goal_arm else 2
+                return 0
+        return 0
+
+    def update(parent: MachineState, child: MachineState, target: MachineState, h_parent: float) -> float:
+        # Seul le bloc déplacé change de support, les blocs en dessous ne changent pas
+        supports, goal_arm = target_of(target)
+        block = child.arm if child.arm is not None else parent.arm
+        return h_parent - block_cost(parent, block, supports, goal_arm) + block_cost(child, block, supports, goal_arm)
+
+    @incremental(update)
+    def heuristic(state: MachineState, target: MachineState) -> float:
+        supports, goal_arm = target_of(target)
+        res = 0
+        if state.arm is not None and state.arm != goal_arm:
+            res += 1
+
+        for stack in state.stacks:
+            # Du bas vers le haut : dès qu'un bloc est mal placé, tous ceux au-dessus le sont aussi
+            placed = True
+            for i in range(len(stack) - 1, -1, -1):
+                support = stack[i + 1] if i + 1 < len(stack) else TABLE
+                placed = placed and supports.get(stack[i]) == support
+                if not placed:
+                    res += 1 if stack[i] == goal_arm else 2
+        return res
+
+    return heuristic
+
+
 def td_3():
-    def heuristic_1(state: MachineState, _) -> float:
-        return 6 - \
-               (ife(state.is_above('A', 'B')) * 1) - \
-               (ife(state.is_above('B', 'C')) * 2) - \
-               (ife(state.is_above('C', None)) * 3)
-
-    def heuristic_2(state: MachineState, _) -> float:
-        return 3 - \
-               (ife(state.is_above('A', 'B'))) - \
-               (ife(state.is_above('B', 'C'))) - \
-               (ife(state.is_above('C', None)))
+    heuristic_1 = above_heuristic(6, [('A', 'B', 1), ('B', 'C', 2), ('C', None, 3)])
+    heuristic_2 = above_heuristic(3, [('A', 'B', 1), ('B', 'C', 1), ('C', None, 1)])
 
     from_state = MachineState(None, [['A'], ['B'], ['C']], 3)
     to_state = MachineState(None, [['A', 'B', 'C']], 3)
@@ -189,19 +385,8 @@ def td_3():
 
 
 def _5():
-    def heuristic_1(state: MachineState, _) -> float:
-        return 10 - \
-               (ife(state.is_above('A', 'B')) * 1) - \
-               (ife(state.is_above('B', 'C')) * 2) - \
-               (ife(state.is_above('C', 'D')) * 3) - \
-               (ife(state.is_above('E', None)) * 4)
-
-    def heuristic_2(state: MachineState, _) -> float:
-        return 4 - \
-               (ife(state.is_above('A', 'B'))) - \
-               (ife(state.is_above('B', 'C'))) - \
-               (ife(state.is_above('C', 'D'))) - \
-               (ife(state.is_above('E', None)))
+    heuristic_1 = above_heuristic(10, [('A', 'B', 1), ('B', 'C', 2), ('C', 'D', 3), ('E', None, 4)])
+    heuristic_2 = above_heuristic(4, [('A', 'B', 1), ('B', 'C', 1), ('C', 'D', 1), ('E', None, 1)])
 
     from_state = MachineState('E', [['C', 'A'], ['B'], ['D']], 3)
     to_state = MachineState(None, [['A', 'B', 'C', 'D', 'E']], 3)
@@ -218,9 +403,19 @@ def _5():
                 False)
 
 
+def _10():
+    # L'heuristique est déduite du but : plus besoin d'écrire les termes à la main
+    from_state = MachineState(None, [['B', 'A', 'E'], ['D', 'C'], ['F', 'G', 'H', 'I', 'J']], 3)
+    to_state = MachineState(None, [['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']], 3)
+
+    wrap_search(from_state.with_hint(to_state), to_state, goal_heuristic(to_state), 1, render_node, def_node_attr,
+                "out/machine/machine-10-goal", False)
+
+
 def main():
     td_3()
     _5()
+    _10()
 
 
 if __name__ == '__main__':
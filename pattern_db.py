@@ -0,0 +1,360 @@
+import itertools
+import json
+import math
+import mmap
+import operator
+import os
+import struct
+from array import array
+
+from a_star import def_node_attr, wrap_search
+from taquin import TaquinState, encode, manhattan, render_node
+from utils import require_numpy
+
+# En-tête d'un fichier de tables : signature, puis longueur de la description JSON.
+# PDB1 : tables indexées par sum(position[i] * size ** i), PDB2 : tables indexées par rang (voir rank),
+# PDB3 : tables indexées par rang qui tiennent compte de la case vide
+_MAGIC = b"PDB3"
+_HEADER = struct.Struct("<4sI")
+
+# Valeur des configurations jamais atteintes par le parcours en largeur
+_UNREACHED = 255
+
+# Taille maximale (en octets) d'une table, qui fixe le nombre de pièces par motif
+_MAX_TABLE_SIZE = 1 << 24
+
+# Nombre maximal de cases pour lequel build_table calcule d'avance les zones de la case vide
+# (2 ** cases * cases entiers, 4 Mo pour un 4x4)
+_ZONE_TABLE_CELLS = 16
+
+
+def default_groups(target: TaquinState) -> list[tuple[int, ...]]:
+    """
+    Découpe les pièces en motifs disjoints, dans l'ordre de leur position finale.
+    On prend le plus de pièces possible par motif (6-6-3 pour un 4x4)
+
+    :param target: L'état but
+    :type target: TaquinState
+    :return: La liste des motifs, chaque motif étant un tuple de valeurs de pièces.
+    """
+    group_size = 1
+    while group_size + 1 < target.size and math.perm(target.size, group_size + 1) <= _MAX_TABLE_SIZE:
+        group_size += 1
+
+    tiles = [value for value in target.tiles if value != 0]
+    return [tuple(tiles[i:i + group_size]) for i in range(0, len(tiles), group_size)]
+
+
+def coefficients(size: int, group_size: int) -> list[int]:
+    """
+    :param size: Nombre de cases
+    :param group_size: Nombre de pièces du motif
+    :return: Le coefficient de chaque pièce dans le rang d'une configuration (voir rank).
+    """
+    return [math.perm(size - 1 - i, group_size - 1 - i) for i in range(group_size)]
+
+
+def rank(positions: list[int], coefficients: list[int]) -> int:
+    """
+    Rang d'une configuration parmi les arrangements de len(positions) cases distinctes parmi size :
+    chaque position compte pour le nombre de cases plus petites qui ne sont pas prises par les pièces précédentes.
+    Les rangs vont de 0 à perm(size, len(positions)) - 1, sans trou.
+
+    :param positions: La position de chaque pièce du motif
+    :param coefficients: Les coefficients du motif (voir coefficients)
+    :return: Le rang de la configuration.
+    """
+    used = 0
+    res = 0
+    for position, coefficient in zip(positions, coefficients):
+        res += (position - bin(used & ((1 << position) - 1)).count("1")) * coefficient
+        used |= 1 << position
+    return res
+
+
+def build_table(target: TaquinState, group: tuple[int, ...]) -> bytearray:
+    """
+    Construit la table d'un motif par un parcours en largeur en arrière depuis l'état but.
+
+    Une configuration du motif est la position de chacune de ses pièces, indexée par son rang parmi
+    les perm(size, len(group)) arrangements possibles (voir rank). Les autres pièces sont ignorées,
+    mais pas la case vide : une pièce du motif ne peut glisser que sur la case vide. Les déplacements
+    de la case vide entre les cases hors du motif ne coûtent rien, un nœud du parcours est donc une
+    configuration et la zone où peut se trouver la case vide (voir flood). La table garde la plus
+    petite distance d'une configuration, quelle que soit cette zone.
+    Seuls les déplacements des pièces du motif sont comptés, les tables de motifs disjoints
+    peuvent donc être additionnées sans surestimer la distance.
+
+    :param target: L'état but
+    :type target: TaquinState
+    :param group: Les pièces du motif
+    :type group: tuple[int, ...]
+    :return: La distance de chaque configuration du motif à sa configuration finale.
+    """
+    size = target.size
+    col_count = target.col_count
+    neighbours = target.board.neighbours
+    weights = [size ** i for i in range(len(group))]
+
+    # Cases sous forme de bits : la case i est le bit 1 << i
+    full = (1 << size) - 1
+    adjacent = [sum(1 << cell for cell in cells) for cells in neighbours]
+    not_first = sum(1 << index for index in range(size) if index % col_count != 0)
+    not_last = sum(1 << index for index in range(size) if index % col_count != col_count - 1)
+
+    def flood(blank: int, free: int) -> int:
+        # Zone de la case vide : les cases libres (hors motif) qu'elle atteint sans déplacer de pièce du motif
+        zone = 1 << blank
+        while True:
+            grown = zone | (free & (((zone & not_last) << 1) | ((zone & not_first) >> 1)
+                                    | (zone << col_count) | (zone >> col_count)) & full)
+            if grown == zone:
+                return zone
+            zone = grown
+
+    if size <= _ZONE_TABLE_CELLS:
+        # Sur un petit taquin, la zone de chaque case est calculée d'avance pour chaque ensemble de cases libres
+        zones = array("I", bytes(4 * (size << size)))
+        for free in range(1 << size):
+            rest = free
+            while rest:
+                zone = flood((rest & -rest).bit_length() - 1, free)
+                rest &= ~zone
+                cells = zone
+                while cells:
+                    cell_bit = cells & -cells
+                    cells ^= cell_bit
+                    zones[free * size + cell_bit.bit_length() - 1] = zone
+
+        def zone_of(blank: int, free: int) -> int:
+            return zones[free * size + blank]
+    else:
+        zone_of = flood
+
+    # Le parcours repère les configurations par sum(position[i] * size ** i), plus simple à mettre à jour
+    # que le rang : cette table provisoire a des trous, elle est compactée à la fin. Un nœud est repéré
+    # par configuration * size + plus petite case de la zone de la case vide, et n'est visité qu'une fois.
+    sparse = bytearray([_UNREACHED]) * (size ** len(group))
+    visited = bytearray((size ** len(group) * size + 7) >> 3)
+
+    positions = [target.positions[value] for value in group]
+    index = sum(position * weight for position, weight in zip(positions, weights))
+    zone = zone_of(target.empty_index, full & ~sum(1 << position for position in positions))
+    start = index * size + (zone & -zone).bit_length() - 1
+    sparse[index] = 0
+    visited[start >> 3] |= 1 << (start & 7)
+    frontier = [start]
+    distance = 0
+
+    while frontier:
+        distance += 1
+        next_frontier = []
+
+        for node in frontier:
+            index, blank = divmod(node, size)
+
+            # On retrouve la position de chaque pièce du motif
+            positions = []
+            rest = index
+            for _ in group:
+                rest, position = divmod(rest, size)
+                positions.append(position)
+
+            free = full & ~sum(1 << position for position in positions)
+            zone = zone_of(blank, free)
+
+            for position, weight in zip(positions, weights):
+                # La pièce glisse sur une case voisine de sa zone, la case vide prend sa place
+                cells = adjacent[position] & zone
+                while cells:
+                    cell_bit = cells & -cells
+                    cells ^= cell_bit
+                    cell = cell_bit.bit_length() - 1
+
+                    child_index = index + (cell - position) * weight
+                    child_zone = zone_of(position, free ^ cell_bit | (1 << position))
+                    child = child_index * size + (child_zone & -child_zone).bit_length() - 1
+                    if not visited[child >> 3] & (1 << (child & 7)):
+                        visited[child >> 3] |= 1 << (child & 7)
+                        if sparse[child_index] == _UNREACHED:
+                            sparse[child_index] = distance
+                        next_frontier.append(child)
+
+        frontier = next_frontier
+
+    # Les arrangements sont énumérés dans l'ordre de leur rang
+    return bytearray(sparse[sum(map(operator.mul, positions, weights))]
+                     for positions in itertools.permutations(range(size), len(group)))
+
+
+class PatternDatabase:
+    """
+    Heuristique additive par bases de motifs disjoints pour le taquin.
+
+    S'utilise comme les autres heuristiques : pdb(state, target).
+    """
+
+    def __init__(self, target: TaquinState, groups: list[tuple[int, ...]], tables: list):
+        self.target = target
+        self.groups = groups
+        self.tables = tables
+        self.coefficients = [coefficients(target.size, len(group)) for group in groups]
+        self.arrays = None  # Motifs, coefficients et tables au format numpy, construits par batch()
+
+    @classmethod
+    def build(cls, target: TaquinState, groups: list[tuple[int, ...]] or None = None) -> "PatternDatabase":
+        """
+        Calcule toutes les tables d'un état but
+
+        :param target: L'état but
+        :param groups: Les motifs, par défaut ceux de default_groups
+        :return: La base de motifs.
+        """
+        if groups is None:
+            groups = default_groups(target)
+        groups = [tuple(group) for group in groups]
+        return cls(target, groups, [build_table(target, group) for group in groups])
+
+    def save(self, file_name: str) -> None:
+        """
+        Enregistre les tables à la suite dans un fichier, précédées d'une description JSON
+
+        :param file_name: Nom du fichier
+        """
+        description = json.dumps({
+            "rows": self.target.rows,
+            "groups": self.groups,
+        }).encode()
+
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(file_name, "wb") as file:
+            file.write(_HEADER.pack(_MAGIC, len(description)))
+            file.write(description)
+            for table in self.tables:
+                file.write(table)
+
+    @classmethod
+    def load(cls, file_name: str) -> "PatternDatabase":
+        """
+        Charge un fichier de tables. Le fichier est projeté en mémoire (mmap) :
+        seules les pages utilisées par la recherche sont lues.
+
+        :param file_name: Nom du fichier
+        :return: La base de motifs.
+        """
+        with open(file_name, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, length = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError(f"{file_name} n'est pas un fichier de tables de motifs")
+
+        description = json.loads(data[_HEADER.size:_HEADER.size + length])
+        target = TaquinState.from_rows(description["rows"])
+        groups = [tuple(group) for group in description["groups"]]
+
+        view = memoryview(data)
+        offset = _HEADER.size + length
+        tables = []
+        for group in groups:
+            table_size = math.perm(target.size, len(group))
+            tables.append(view[offset:offset + table_size])
+            offset += table_size
+
+        return cls(target, groups, tables)
+
+    @classmethod
+    def open(cls, target: TaquinState,
+             groups: list[tuple[int, ...]] or None = None,
+             directory: str = "pdb") -> "PatternDatabase":
+        """
+        Charge les tables d'un état but depuis {directory}, en les calculant et en les enregistrant au besoin
+
+        :param target: L'état but
+        :param groups: Les motifs, par défaut ceux de default_groups
+        :param directory: Le dossier des fichiers de tables
+        :return: La base de motifs.
+        """
+        if groups is None:
+            groups = default_groups(target)
+
+        name = "-".join(".".join(map(str, group)) for group in groups)
+        file_name = os.path.join(directory,
+                                 f"taquin-{target.row_count}x{target.col_count}-{target.code:x}-{name}.pdb")
+
+        if os.path.exists(file_name):
+            with open(file_name, "rb") as file:
+                magic, _ = _HEADER.unpack(file.read(_HEADER.size))
+            if magic == _MAGIC:  # Sinon, le fichier d'un ancien format est recalculé
+                return cls.load(file_name)
+
+        database = cls.build(target, groups)
+        database.save(file_name)
+        return database
+
+    def __call__(self, state: TaquinState, target: TaquinState) -> float:
+        if target != self.target:
+            raise ValueError("La base de motifs a été construite pour un autre état but")
+
+        positions = state.positions
+        res = 0
+        for group, group_coefficients, table in zip(self.groups, self.coefficients, self.tables):
+            res += table[rank([positions[value] for value in group], group_coefficients)]
+        return res
+
+    def batch(self, states: list[TaquinState], target: TaquinState) -> list[int]:
+        """
+        Évaluation groupée avec numpy : la position de chaque pièce de chaque état est calculée d'un bloc,
+        puis le rang de chaque motif (voir rank) et la lecture de sa table sont faits pour tous les états à la fois.
+        """
+        np = require_numpy()
+        if target != self.target:
+            raise ValueError("La base de motifs a été construite pour un autre état but")
+
+        if self.arrays is None:
+            self.arrays = [
+                (np.array(group, dtype=np.intp),
+                 np.array(group_coefficients, dtype=np.intp),
+                 np.frombuffer(table, dtype=np.uint8))
+                for group, group_coefficients, table in zip(self.groups, self.coefficients, self.tables)
+            ]
+
+        tiles = encode(states)
+        positions = np.empty_like(tiles)
+        positions[np.arange(len(states))[:, None], tiles] = np.arange(tiles.shape[1])
+
+        res = 0
+        for group, group_coefficients, table in self.arrays:
+            group_positions = positions[:, group]
+            # smaller[n, i, j] : la pièce j précède la pièce i dans le motif et occupe une case plus petite
+            smaller = group_positions[:, None, :] < group_positions[:, :, None]
+            smaller &= np.tri(len(group), k=-1, dtype=bool)
+            res = res + table[(group_positions - smaller.sum(axis=2)) @ group_coefficients]
+        return res.tolist()
+
+
+def main():
+    from_state = TaquinState.from_rows([
+        [12, 1, 3, 4],
+        [2, 13, 14, 5],
+        [11, 10, 8, 6],
+        [9, 15, 7, 0]
+    ])
+
+    to_state = TaquinState.from_rows([
+        [2, 12, 3, 4],
+        [1, 13, 0, 5],
+        [11, 14, 7, 8],
+        [10, 9, 15, 6]
+    ])
+
+    pdb = PatternDatabase.open(to_state)
+    wrap_search(from_state, to_state, pdb, 1, render_node, def_node_attr, "out/taquin/taquin-4x4-pdb", False)
+    wrap_search(from_state, to_state, manhattan, 1, render_node, def_node_attr, "out/taquin/taquin-4x4-manhattan", False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Callable
+
+from batch import DOMAINS, _limit_memory, read_instances, solve
+from distance_cache import DistanceCache
+
+# Chemin par défaut de la socket du service
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), "a-star-solver.sock")
+
+# Heuristiques admissibles qui tiennent compte du but : seules leurs recherches alimentent le cache des
+# distances exactes (hamming compare les cases à la disposition rangée, quel que soit le but)
+ADMISSIBLE = {"zero", "manhattan", "pdb", "goal"}
+
+# Clés d'une requête qui ne changent pas son résultat
+_REQUEST_KEYS = {"id", "deadline"}
+
+# État d'un processus de calcul, conservé d'une requête à l'autre : caches des distances, par coût d'avancement
+_distances: {float: DistanceCache} = {}
+_cache_entries = 100_000
+
+
+def _init_worker(memory: int or None, cache_entries: int) -> None:
+    """
+    Initialisation d'un processus de calcul : limite de mémoire et taille des caches
+    """
+    global _cache_entries
+    _limit_memory(memory)
+    _cache_entries = cache_entries
+
+
+@lru_cache(maxsize=64)
+def _heuristic(domain: str, spec: str, goal) -> Callable:
+    """
+    Heuristiques déjà construites (tables de motifs, termes de la machine...), par domaine, spécification JSON et but
+    """
+    return DOMAINS[domain][1](json.loads(spec), goal)
+
+
+def _solve(instance: dict, timeout: float or None) -> dict:
+    """
+    Résolution dans un processus de calcul, avec les heuristiques et les distances déjà calculées par ce processus
+    """
+    cache = None
+    if isinstance(instance.get("heuristic"), str) and instance["heuristic"] in ADMISSIBLE:
+        cost = instance.get("cost", 1)
+        cache = _distances.get(cost)
+        if cache is None:
+            cache = _distances[cost] = DistanceCache(_cache_entries)
+
+    return solve(instance, timeout,
+                 heuristic=lambda domain, spec, goal: _heuristic(domain, json.dumps(spec, sort_keys=True), goal),
+                 cache=cache)
+
+
+class SolverService:
+    """
+    Service de résolution résident, à l'écoute sur une socket Unix.
+
+    Le protocole est du JSON lines : chaque ligne reçue est une instance au format de batch.solve, avec
+    optionnellement deadline, le temps limite de la requête en secondes. Chaque réponse est le résultat de
+    batch.solve, avec le même id que la requête ; les réponses d'une connexion arrivent dans l'ordre où les
+    recherches se terminent. La requête {"command": "stats"} renvoie les compteurs du service.
+
+    Les recherches sont faites par un groupe de processus qui gardent leurs heuristiques et leurs caches de
+    distances d'une requête à l'autre. Des requêtes identiques en cours de calcul partagent une seule recherche.
+    """
+
+    def __init__(self, socket_path: str = SOCKET_PATH,
+                 workers: int or None = None,
+                 timeout: float or None = None,
+                 memory: int or None = None,
+                 cache_entries: int = 100_000):
+        """
+        :param socket_path: Chemin de la socket
+        :param workers: Nombre de processus, par défaut le nombre de cœurs
+        :param timeout: Temps limite par défaut d'une requête, et temps maximal d'une recherche, en secondes.
+            Chaque recherche est arrêtée dans son processus au temps limite de la requête qui l'a lancée
+        :param memory: Mémoire maximale de chaque processus, en Mo
+        :param cache_entries: Nombre maximal de distances gardées par chaque processus et chaque coût
+        """
+        self.socket_path = socket_path
+        self.workers = workers
+        self.timeout = timeout
+        self.memory = memory
+        self.cache_entries = cache_entries
+        self.executor = None
+        # Recherches en cours et leur temps limite (None : sans limite), par clé de requête
+        self.in_flight: {str: (asyncio.Future, float or None)} = {}
+        self.counters = {"requests": 0, "searches": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.memory, self.cache_entries))
+
+    def _done(self, key: str, future: asyncio.Future) -> None:
+        if self.in_flight.get(key, (None,))[0] is future:
+            del self.in_flight[key]
+        if not future.cancelled():
+            future.exception()  # Évite l'avertissement si toutes les requêtes ont déjà abandonné
+
+    async def solve(self, request: dict) -> dict:
+        """
+        :param request: Une instance au format de batch.solve, avec optionnellement deadline
+        :return: Le résultat de batch.solve, avec coalesced à True si la recherche était déjà en cours.
+        """
+        if request.get("command") == "stats":
+            return {**self.counters, "in_flight": len(self.in_flight), "id": request.get("id")}
+
+        self.counters["requests"] += 1
+        instance = {key: value for key, value in request.items() if key not in _REQUEST_KEYS}
+        deadline = request.get("deadline", self.timeout)
+        key = json.dumps(instance, sort_keys=True)
+
+        # Temps limite de la recherche dans le processus de calcul : celui de la requête, au plus self.timeout
+        limit = deadline
+        if self.timeout is not None and (limit is None or limit > self.timeout):
+            limit = self.timeout
+
+        # Une requête ne partage une recherche en cours que si celle-ci dispose d'au moins autant de temps :
+        # sinon elle en lance une nouvelle, que les requêtes suivantes partageront
+        future, search_limit = self.in_flight.get(key, (None, None))
+        coalesced = future is not None and (search_limit is None or (limit is not None and limit <= search_limit))
+        executor = self.executor
+        try:
+            if coalesced:
+                self.counters["coalesced"] += 1
+            else:
+                self.counters["searches"] += 1
+                future = asyncio.get_running_loop().run_in_executor(executor, _solve, instance, limit)
+                self.in_flight[key] = future, limit
+                future.add_done_callback(lambda done: self._done(key, done))
+
+            # La recherche continue après le temps limite d'une requête, pour les autres requêtes qui la partagent
+            result = await asyncio.wait_for(asyncio.shield(future), deadline)
+        except asyncio.TimeoutError:
+            result = {"status": "timeout", "time": deadline}
+        except BrokenProcessPool as e:  # Un processus de calcul a été arrêté (mémoire épuisée, signal...)
+            self.counters["errors"] += 1
+            if not coalesced and self.executor is executor:
+                self.executor = self._new_executor()
+            result = {"status": "error", "error": repr(e)}
+
+        # La recherche a aussi pu être arrêtée par le temps limite du processus de calcul
+        if result["status"] == "timeout":
+            self.counters["timeouts"] += 1
+        return {**result, "id": request.get("id"), "coalesced": coalesced}
+
+    async def _respond(self, line: bytes, writer: asyncio.StreamWriter) -> None:
+        # Toute requête reçoit une réponse, même invalide
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Une requête doit être un objet JSON")
+            request_id = request.get("id")
+            result = await self.solve(request)
+        except Exception as e:
+            self.counters["errors"] += 1
+            result = {"status": "error", "error": repr(e), "id": request_id}
+
+        writer.write(json.dumps(result).encode() + b"\n")
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Les requêtes d'une connexion sont traitées en parallèle
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(self._respond(line, writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        """
+        Démarre le service, jusqu'à SIGINT ou SIGTERM
+        """
+        if os.path.exists(self.socket_path):  # Socket d'un service précédent
+            os.unlink(self.socket_path)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        self.executor = self._new_executor()
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=self.socket_path, limit=2 ** 24)
+            async with server:
+                await stop.wait()
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+class SolverClient:
+    """
+    Client du service de résolution
+
+    with SolverClient() as client:
+        result = client.solve({"domain": "taquin", "start": ..., "goal": ..., "heuristic": "manhattan"})
+    """
+
+    def __init__(self, socket_path: str = SOCKET_PATH):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.file = self.socket.makefile("rwb")
+
+    def solve(self, instance: dict, deadline: float or None = None) -> dict:
+        """
+        :param instance: Une instance au format de batch.solve
+        :param deadline: Temps limite en secondes, par défaut celui du service
+        :return: Le résultat de batch.solve.
+        """
+        return self.solve_many([instance], deadline)[0]
+
+    def solve_many(self, instances: list[dict], deadline: float or None = None) -> list[dict]:
+        """
+        Envoie toutes les instances avant de lire les réponses : le service les résout en parallèle
+
+        :return: Les résultats, dans l'ordre des instances.
+        """
+        for i, instance in enumerate(instances):
+            request = {**instance, "id": i}
+            if deadline is not None:
+                request["deadline"] = deadline
+            self.file.write(json.dumps(request).encode() + b"\n")
+        self.file.flush()
+
+        results = [None] * len(instances)
+        for _ in instances:
+            result = json.loads(self.file.readline())
+            i = result["id"]
+            result["id"] = instances[i].get("id")
+            results[i] = result
+        return results
+
+    def stats(self) -> dict:
+        """
+        :return: Les compteurs du service.
+        """
+        self.file.write(b'{"command": "stats"}\n')
+        self.file.flush()
+        return json.loads(self.file.readline())
+
+    def close(self) -> None:
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self) -> "SolverClient":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service de résolution résident, sur une socket Unix")
+    parser.add_argument("-s", "--socket", default=SOCKET_PATH, help="Chemin de la socket")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Démarre le service")
+    serve.add_argument("-j", "--workers", type=int, default=None, help="Nombre de processus")
+    serve.add_argument("-t", "--timeout", type=float, default=None, help="Temps limite par requête (s)")
+    serve.add_argument("-m", "--memory", type=int, default=None, help="Mémoire maximale par processus (Mo)")
+    serve.add_argument("-c", "--cache", type=int, default=100_000, help="Distances gardées par processus")
+
+    client = commands.add_parser("solve", help="Résout des instances avec le service")
+    client.add_argument("instances", help="Fichier JSON lines des instances")
+    client.add_argument("-d", "--deadline", type=float, default=None, help="Temps limite par instance (s)")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        service = SolverService(args.socket, args.workers, args.timeout, args.memory, args.cache)
+        asyncio.run(service.serve())
+    else:
+        with SolverClient(args.socket) as solver:
+            for result in solver.solve_many(read_instances(args.instances), args.deadline):
+                sys.stdout.write(json.dumps(result) + "\n")
+
+
+if __name__ == '__main__':
+    main()
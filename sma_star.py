@@ -0,0 +1,215 @@
+import sys
+from heapq import heappop, heappush
+from itertools import count
+from typing import Callable
+
+from a_star import AStarNode, AStarResult
+
+_INF = float("inf")
+
+
+class _Node:
+    """
+    Nœud de l'arbre de recherche de SMA*. Un même état peut apparaître dans plusieurs branches.
+    """
+
+    __slots__ = ("state", "parent", "g", "depth", "own_f", "f", "successors", "next_index", "children", "forgotten",
+                 "alive")
+
+    def __init__(self, state: AStarNode, parent: "_Node" or None, g: float, depth: int, f: float):
+        self.state = state
+        self.parent = parent
+        self.g = g
+        self.depth = depth
+        self.own_f = f  # Borne inférieure des successeurs pas encore générés
+        self.f = f  # Valeur remontée : la plus petite borne de tout le sous-arbre, oublié ou non
+        self.successors = None  # Calculés au premier développement
+        self.next_index = 0  # Prochain successeur jamais généré
+        self.children = {}  # État -> nœud fils en mémoire
+        self.forgotten = {}  # État -> f d'un fils supprimé faute de mémoire
+        self.alive = True
+
+    def has_ungenerated(self) -> bool:
+        return self.successors is None or self.next_index < len(self.successors)
+
+    def generation_f(self) -> float:
+        """
+        :return: La plus petite borne des successeurs qu'on peut (re)générer, l'infini s'il n'y en a plus.
+        """
+        res = self.own_f if self.has_ungenerated() else _INF
+        if self.forgotten:
+            res = min(res, min(self.forgotten.values()))
+        return res
+
+    def backed_up_f(self) -> float:
+        res = self.generation_f()
+        for child in self.children.values():
+            res = min(res, child.f)
+        return res
+
+
+def sma_star_search(from_state: AStarNode,
+                    to_state: AStarNode,
+                    h: Callable[[any, any], float],
+                    cost: float = 1,
+                    max_nodes: int or None = None,
+                    max_bytes: int or None = None) -> AStarResult or None:
+    """
+    Réalise une recherche SMA* (A* simplifié à mémoire bornée).
+
+    L'arbre de recherche garde au plus {max_nodes} nœuds. Quand la mémoire est pleine, on supprime la feuille
+    de plus grand f (la moins profonde à f égal) ; son parent retient le f de la feuille oubliée et pourra la
+    régénérer plus tard. Les f sont remontés vers la racine, chaque nœud connaissant donc la meilleure borne de son
+    sous-arbre. Le chemin trouvé est optimal s'il tient dans la mémoire (au plus max_nodes états).
+
+    :param from_state: L'état initial à partir duquel commencer la recherche
+    :type from_state: AStarNode
+    :param to_state: L'état du but
+    :type to_state: AStarNode
+    :param h: la fonction heuristique
+    :param cost: coût d'avancement dans une branche
+    :param max_nodes: Nombre maximal de nœuds en mémoire
+    :param max_bytes: Mémoire maximale, convertie en nombre de nœuds avec la taille (estimée) du nœud initial
+    :return: AStarResult dont g_score, h_score, parent et visited ne contiennent que les nœuds du chemin,
+        steps étant le nombre total de nœuds générés. None si aucun chemin ne tient dans la mémoire.
+    """
+    if not from_state.can_reach(to_state):
+        return None
+
+    root = _Node(from_state, None, 0, 0, h(from_state, to_state))
+
+    if max_bytes is not None:
+        node_size = sys.getsizeof(root) + sys.getsizeof(from_state) \
+                    + sys.getsizeof(getattr(from_state, "__dict__", {}))
+        by_bytes = max(1, max_bytes // node_size)
+        max_nodes = by_bytes if max_nodes is None else min(max_nodes, by_bytes)
+    if max_nodes is None:
+        raise ValueError("sma_star_search a besoin de max_nodes ou max_bytes")
+
+    max_depth = max_nodes - 1  # Un chemin plus long ne tiendrait pas en mémoire
+    used = 1
+    steps = 0
+    counter = count()
+
+    # Nœuds qui ont un successeur à (re)générer, par plus petit f puis plus grande profondeur
+    best = []
+    # Feuilles supprimables, par plus grand f puis plus petite profondeur
+    worst = []
+
+    def push_best(node: _Node) -> None:
+        generation_f = node.generation_f()
+        if generation_f != _INF or node.state == to_state:
+            heappush(best, (node.f if node.state == to_state else generation_f, -node.depth, next(counter), node))
+
+    def push_worst(node: _Node) -> None:
+        if node is not root and not node.children:
+            heappush(worst, (-node.f, node.depth, next(counter), node, node.f))
+
+    def backup(node: _Node) -> None:
+        # On remonte les f tant qu'ils changent
+        while node is not None:
+            f = node.backed_up_f()
+            if f == node.f:
+                break
+            node.f = f
+            push_worst(node)
+            node = node.parent
+
+    def on_path(node: _Node, state: AStarNode) -> bool:
+        while node is not None:
+            if node.state == state:
+                return True
+            node = node.parent
+        return False
+
+    def delete_worst(keep: _Node) -> bool:
+        # Supprime la pire feuille (autre que {keep}) et retient son f dans son parent
+        while worst:
+            _, _, _, node, f = heappop(worst)
+            if not node.alive or node.children or node.f != f or node is keep:
+                continue
+
+            node.alive = False
+            parent = node.parent
+            del parent.children[node.state]
+            parent.forgotten[node.state] = node.f
+            push_best(parent)
+            push_worst(parent)
+            return True
+        return False
+
+    push_best(root)
+
+    while best:
+        key, _, _, current = heappop(best)
+        if not current.alive:
+            continue
+
+        if current.state == to_state:
+            if key != current.f:
+                continue
+            path = []
+            node = current
+            while node is not None:
+                path.append(node.state)
+                node = node.parent
+            path.reverse()
+            return AStarResult(
+                from_state,
+                to_state,
+                path,
+                {state: i * cost for i, state in enumerate(path)},
+                {state: h(state, to_state) for state in path},
+                {state: path[i] for i, state in enumerate(path[1:])},
+                {state: i for i, state in enumerate(path)},
+                steps
+            )
+
+        if key != current.generation_f():  # Entrée périmée
+            continue
+        if key == _INF:
+            break
+
+        # Choix du successeur : le prochain jamais généré, ou le meilleur oublié
+        if current.successors is None:
+            current.successors = [child for child in current.state.children()
+                                  if child != current.state and not on_path(current.parent, child)]
+
+        if current.next_index < len(current.successors) and \
+                (not current.forgotten or current.own_f <= min(current.forgotten.values())):
+            state = current.successors[current.next_index]
+            current.next_index += 1
+            steps += 1
+            g = current.g + cost
+            f = max(current.own_f, g + h(state, to_state))  # Les f ne décroissent pas le long d'un chemin
+        elif current.forgotten:
+            state = min(current.forgotten, key=current.forgotten.get)
+            f = current.forgotten.pop(state)
+            g = current.g + cost
+        else:  # Aucun successeur
+            backup(current)
+            continue
+
+        if state != to_state and current.depth + 1 >= max_depth:
+            f = _INF
+
+        if f != _INF and used >= max_nodes:
+            if delete_worst(current):
+                used -= 1
+            else:
+                f = _INF  # Plus aucune place : le fils ne peut pas être gardé
+
+        child = _Node(state, current, g, current.depth + 1, f)
+        if f == _INF:
+            # Le fils ne mène à rien dans la mémoire disponible : on le retient directement comme oublié
+            current.forgotten[state] = _INF
+        else:
+            current.children[state] = child
+            used += 1
+            push_best(child)
+            push_worst(child)
+
+        backup(current)
+        push_best(current)
+
+    return None
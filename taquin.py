@@ -1,101 +1,296 @@
 from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from math import factorial
+
+from a_star import AStarNode, AStarResult, StateIndex, batched, def_node_attr, incremental, wrap_search
+from utils import ife, require_numpy
+
+
+class Board:
+    """
+    Forme d'un taquin, partagée par tous les états de même taille.
+    Les voisins et les distances entre cases sont calculés une seule fois par forme.
+    """
+
+    _boards: {(int, int): "Board"} = {}
+
+    def __init__(self, row_count: int, col_count: int):
+        self.row_count = row_count
+        self.col_count = col_count
+        self.size = row_count * col_count
+        self.shape = (row_count, col_count)
+        self.bits = max(1, (self.size - 1).bit_length())
+        self.mask = (1 << self.bits) - 1
+        self.shifts = tuple(index * self.bits for index in range(self.size))
+
+        # Pour chaque case, les cases voisines dans l'ordre droite, haut, gauche, bas
+        neighbours = []
+        for index in range(self.size):
+            x = index % col_count
+            y = index // col_count
+            cells = []
+            if x != col_count - 1:
+                cells.append(index + 1)
+            if y != 0:
+                cells.append(index - col_count)
+            if x != 0:
+                cells.append(index - 1)
+            if y != row_count - 1:
+                cells.append(index + col_count)
+            neighbours.append(tuple(cells))
+        self.neighbours = tuple(neighbours)
+
+        # distances[a][b] : distance de manhattan entre les cases a et b
+        self.distances = tuple(
+            tuple(distance(from_index, to_index, col_count) for to_index in range(self.size))
+            for from_index in range(self.size)
+        )
+
+    @classmethod
+    def of(cls, row_count: int, col_count: int) -> "Board":
+        """
+        :return: La forme {row_count}x{col_count}, construite au premier appel.
+        """
+        key = (row_count, col_count)
+        board = cls._boards.get(key)
+        if board is None:
+            board = cls._boards[key] = cls(row_count, col_count)
+        return board
 
-from a_star import AStarNode, AStarResult, def_node_attr, wrap_search
-from utils import ife, deepcopy2d
+    def __reduce__(self):
+        # Un processus qui reçoit un état retrouve (ou construit) ses propres tables
+        return Board.of, (self.row_count, self.col_count)
 
 
 @dataclass(frozen=True, order=True)  # Le nombre d'étapes change aussi selon l'ordre.
 class TaquinState(AStarNode):
-    rows: list[list[int]] = field(hash=False)
-    cache_index: {int: int} = field(default_factory=dict, hash=False)
+    # Les cases sont compactées dans un seul entier : la case d'index i occupe les bits
+    # [i * bits, (i + 1) * bits[. Le hash et l'égalité se font donc en O(1). Deux formes différentes
+    # (2x3 et 3x2) peuvent avoir le même code : la forme fait partie de l'égalité et du hash.
+    code: int
+    board: Board = field(compare=False, repr=False)
+    empty_index: int = field(compare=False)
+
+    @classmethod
+    def from_rows(cls, rows: list[list[int]]) -> "TaquinState":
+        """
+        Construit un état à partir d'une liste de lignes
+
+        :param rows: Les lignes du taquin, 0 représentant la case vide
+        :type rows: list[list[int]]
+        :return: L'état correspondant.
+        """
+        board = Board.of(len(rows), len(rows[0]))
+
+        code = 0
+        empty_index = -1
+        for index, value in enumerate(value for row in rows for value in row):
+            code |= value << board.shifts[index]
+            if value == 0:
+                empty_index = index
 
-    def __post_init__(self):
-        self.update_indexes()
+        return cls(code, board, empty_index)
+
+    @property
+    def row_count(self) -> int:
+        return self.board.row_count
 
     @property
-    def col_count(self):
-        return len(self.rows[0])
+    def col_count(self) -> int:
+        return self.board.col_count
 
     @property
-    def row_count(self):
-        return len(self.rows)
+    def bits(self) -> int:
+        return self.board.bits
 
     @property
     def size(self):
-        return self.row_count * self.col_count
+        return self.board.size
+
+    @property
+    def rows(self) -> list[list[int]]:
+        tiles = self.tiles
+        return [list(tiles[y * self.col_count:(y + 1) * self.col_count]) for y in range(self.row_count)]
+
+    @cached_property
+    def tiles(self) -> tuple[int, ...]:
+        """
+        :return: La valeur de chaque case, dans l'ordre de lecture.
+        """
+        code = self.code
+        mask = self.board.mask
+        return tuple((code >> shift) & mask for shift in self.board.shifts)
+
+    @cached_property
+    def positions(self) -> tuple[int, ...]:
+        """
+        :return: L'index de chaque valeur (positions[v] est la case où se trouve v).
+        """
+        positions = [-1] * self.size
+        for index, value in enumerate(self.tiles):
+            positions[value] = index
+        return tuple(positions)
+
+    @cached_property
+    def goal_distances(self) -> tuple[tuple[int, ...], ...]:
+        """
+        Table utilisée quand cet état est le but : goal_distances[v][i] est la distance de manhattan
+        de la case i à la case finale de la pièce v. La ligne de la case vide est nulle.
+
+        :return: La table des distances, construite une seule fois par état but.
+        """
+        distances = self.board.distances
+        zeros = (0,) * self.size
+        return tuple(distances[position] if value != 0 else zeros for value, position in enumerate(self.positions))
 
     def __eq__(self, other):
-        for row in self.rows:
-            for value in row:
-                if self.get_index(value) != other.get_index(value):
-                    return False
+        if not isinstance(other, TaquinState):
+            return NotImplemented
+        return self.code == other.code and (self.board is other.board or self.board.shape == other.board.shape)
 
-        return True
+    def __hash__(self):
+        return hash((self.code, self.board.shape))
 
-    def update_indexes(self) -> None:
-        for y, row in enumerate(self.rows):
-            for index, v in enumerate(row):
-                self.cache_index[v] = index + (y * self.col_count)
+    def __reduce__(self):
+        # On ne sérialise pas les propriétés en cache (tiles, positions)
+        return TaquinState, (self.code, self.board, self.empty_index)
+
+    def can_reach(self, target: "TaquinState") -> bool:
+        """
+        Test de solvabilité, quelle que soit la disposition du but.
+
+        Chaque déplacement échange la case vide avec une voisine : il change la parité de la permutation
+        (case vide comprise) et celle de la distance de manhattan de la case vide à sa place finale.
+        Les deux parités restent donc égales, et c'est une condition suffisante.
+
+        :param target: L'état du but
+        :type target: TaquinState
+        :return: True si le but peut être atteint depuis cet état.
+        """
+        if self.board is not target.board or sorted(self.tiles) != sorted(target.tiles):
+            return False
+
+        # Case finale de la pièce de chaque case, puis nombre de cycles de cette permutation
+        final_positions = target.positions
+        permutation = [final_positions[value] for value in self.tiles]
+        seen = [False] * self.size
+        cycles = 0
+        for index in range(self.size):
+            if not seen[index]:
+                cycles += 1
+                while not seen[index]:
+                    seen[index] = True
+                    index = permutation[index]
+
+        transpositions = self.size - cycles
+        return transpositions % 2 == self.board.distances[self.empty_index][target.empty_index] % 2
 
     def get_index(self, value: int) -> int:
-        if value in self.cache_index:
-            return self.cache_index[value]
+        if 0 <= value < self.size:
+            return self.positions[value]
         return -1
 
-    def children(self) -> list:
+    def tile(self, index: int) -> int:
         """
-        Construit la liste des nœuds fils du nœud actuel
-
-        :return: Une liste d'états.
+        :param index: L'index de la case
+        :type index: int
+        :return: La valeur de la pièce sur cette case.
         """
+        return (self.code >> self.board.shifts[index]) & self.board.mask
 
-        children = []
-
-        empty_index = self.get_index(0)
-        x = empty_index % self.col_count
-        y = empty_index // self.row_count
+    def move(self, index: int) -> "TaquinState":
+        """
+        Construit l'état obtenu en faisant glisser la pièce de la case {index} dans la case vide
 
-        # Échange droit
-        if x != self.col_count - 1:
-            new_rows = deepcopy2d(self.rows)
+        :param index: L'index de la pièce à déplacer, qui doit être voisine de la case vide
+        :type index: int
+        :return: Le nouvel état.
+        """
+        shifts = self.board.shifts
+        value = (self.code >> shifts[index]) & self.board.mask
+        # La case vide vaut 0 : il suffit d'ajouter la pièce à sa nouvelle place et de la retirer de l'ancienne
+        code = self.code + (value << shifts[self.empty_index]) - (value << shifts[index])
+        return TaquinState(code, self.board, index)
 
-            prev = new_rows[y][x + 1]
-            new_rows[y][x + 1] = new_rows[y][x]
-            new_rows[y][x] = prev
+    def children(self) -> list:
+        """
+        Construit la liste des nœuds fils du nœud actuel
 
-            children.append(TaquinState(new_rows))
+        :return: Une liste d'états.
+        """
 
-        # Échange haut
-        if y != 0:
-            new_rows = deepcopy2d(self.rows)
+        # Les voisins de la case vide sont dans l'ordre droite, haut, gauche, bas
+        return [self.move(index) for index in self.board.neighbours[self.empty_index]]
 
-            prev = new_rows[y - 1][x]
-            new_rows[y - 1][x] = new_rows[y][x]
-            new_rows[y][x] = prev
+    def key(self) -> int:
+        return self.code
 
-            children.append(TaquinState(new_rows))
+    def moves(self) -> list:
+        """
+        Génération paresseuse des fils : le code de chaque fils est calculé sans construire l'état
 
-        # Échange gauche
-        if x != 0:
-            new_rows = deepcopy2d(self.rows)
+        :return: Les couples (code du fils, index de la pièce déplacée).
+        """
+        code = self.code
+        shifts = self.board.shifts
+        mask = self.board.mask
+        empty_shift = shifts[self.empty_index]
 
-            prev = new_rows[y][x - 1]
-            new_rows[y][x - 1] = new_rows[y][x]
-            new_rows[y][x] = prev
+        res = []
+        for index in self.board.neighbours[self.empty_index]:
+            value = (code >> shifts[index]) & mask
+            res.append((code + (value << empty_shift) - (value << shifts[index]), index))
+        return res
 
-            children.append(TaquinState(new_rows))
+    def apply(self, move: int) -> "TaquinState":
+        return self.move(move)
 
-        # Échange bas
-        if y != self.row_count - 1:
-            new_rows = deepcopy2d(self.rows)
 
-            prev = new_rows[y + 1][x]
-            new_rows[y + 1][x] = new_rows[y][x]
-            new_rows[y][x] = prev
+class TaquinIndex(StateIndex):
+    """
+    Numérotation parfaite des états qui peuvent atteindre un but.
 
-            children.append(TaquinState(new_rows))
+    Le rang est case vide * (n - 1)! / 2 + rang lexicographique des pièces / 2 : à case vide fixée, seule une
+    permutation des pièces sur deux peut atteindre le but, et deux permutations de rangs 2k et 2k + 1 ne diffèrent
+    que par l'échange des deux dernières pièces, donc par leur parité. Il y a ainsi n! / 2 rangs
+    (181 440 pour un 3x3), tous atteignables.
+    """
 
-        return children
+    def __init__(self, target: TaquinState):
+        """
+        :param target: L'état but
+        """
+        self.board = target.board
+        piece_count = self.board.size - 1
+        self.block = factorial(piece_count) // 2  # Nombre de rangs par position de la case vide
+        self.size = self.board.size * self.block
+        # Poids de chaque pièce dans le rang lexicographique, dans l'ordre de lecture
+        self.factorials = tuple(factorial(piece_count - 1 - i) for i in range(piece_count))
+
+    def rank(self, code: int) -> int:
+        """
+        :param code: Le code d'un état (voir TaquinState.key)
+        :return: Le rang de l'état.
+        """
+        mask = self.board.mask
+        factorials = self.factorials
+
+        # Chaque pièce compte pour le nombre de pièces plus petites qui ne sont pas encore placées
+        used = 0
+        res = 0
+        i = 0
+        empty_index = 0
+        for index, shift in enumerate(self.board.shifts):
+            value = (code >> shift) & mask
+            if value:
+                bit = 1 << value
+                res += (value - 1 - bin(used & (bit - 1)).count("1")) * factorials[i]
+                used |= bit
+                i += 1
+            else:
+                empty_index = index
+
+        return empty_index * self.block + (res >> 1)
 
 
 def render_node(node: TaquinState, result: AStarResult) -> str:
@@ -127,37 +322,93 @@ def render_node(node: TaquinState, result: AStarResult) -> str:
 
 def hamming(state: TaquinState, _: TaquinState) -> float:
     # Nombre de pièces qui ne sont pas à leur position (distance Hamming)
-    state.update_indexes()
+    tiles = state.tiles
     res = 0
     for i in range(state.size - 1):
-        res += ife(state.get_index(i + 1) == i, a=0, b=1)
+        res += ife(tiles[i] == i + 1, a=0, b=1)
     return res
 
 
-def manhattan(state: TaquinState, final_state: TaquinState) -> float:
-    state.update_indexes()
-    res = 0
-    # Pour chaque point, on calcule la distance entre le point actuel et le point final
-    # La somme donne la distance de manhattan.
-    for i in range(state.size):
-        from_index = state.get_index(i)
-        to_index = final_state.get_index(i)
+def distance(from_index: int, to_index: int, col_count: int) -> int:
+    """
+    :return: La distance de manhattan entre deux cases.
+    """
+    y = (from_index // col_count) - (to_index // col_count)
+    x = (from_index % col_count) - (to_index % col_count)
+    return abs(y) + abs(x)
 
-        y = (from_index // state.row_count) - (to_index // state.row_count)
-        x = (from_index % state.col_count) - (to_index % state.col_count)
 
-        res += abs(y) + abs(x)
+def manhattan_update(parent: TaquinState, child: TaquinState, final_state: TaquinState, h_parent: float) -> float:
+    # Seule la pièce déplacée change de place : elle passe de child.empty_index à parent.empty_index
+    goal_distances = final_state.goal_distances[parent.tile(child.empty_index)]
+    return h_parent + goal_distances[parent.empty_index] - goal_distances[child.empty_index]
+
+
+@lru_cache(maxsize=None)
+def _decoder(board: Board):
+    """
+    Tables numpy pour décoder les états d'une forme : le code d'un état est découpé en mots de 64 bits
+    qui contiennent chacun un nombre entier de cases.
+
+    :return: (cases par mot, nombre de mots, mot de chaque case, décalage de chaque case dans son mot, index des cases)
+    """
+    np = require_numpy()
+    per_word = 64 // board.bits
+    word_count = -(-board.size // per_word)
+    words = np.array([index // per_word for index in range(board.size)], dtype=np.intp)
+    shifts = np.array([(index % per_word) * board.bits for index in range(board.size)], dtype=np.uint64)
+    return per_word, word_count, words, shifts, np.arange(board.size)
+
+
+def encode(states: list[TaquinState]):
+    """
+    :param states: Des états de même forme
+    :return: Un tableau numpy (len(states), size) : la valeur de chaque case de chaque état.
+    """
+    np = require_numpy()
+    board = states[0].board
+    per_word, word_count, words, shifts, _ = _decoder(board)
+    word_bits = per_word * board.bits
+    word_mask = (1 << word_bits) - 1
+
+    codes = np.array([[(state.code >> (i * word_bits)) & word_mask for i in range(word_count)] for state in states],
+                     dtype=np.uint64)
+    return ((codes[:, words] >> shifts) & np.uint64(board.mask)).astype(np.intp)
+
+
+@lru_cache(maxsize=64)
+def _goal_distance_array(final_state: TaquinState):
+    np = require_numpy()
+    return np.array(final_state.goal_distances, dtype=np.int32)
+
+
+def manhattan_batch(states: list[TaquinState], final_state: TaquinState) -> list[int]:
+    # Une ligne par état : on lit la distance de chaque case dans la table du but, puis on somme les lignes
+    tiles = encode(states)
+    cells = _decoder(final_state.board)[4]
+    return _goal_distance_array(final_state)[tiles, cells].sum(axis=1).tolist()
+
+
+@batched(manhattan_batch)
+@incremental(manhattan_update)
+def manhattan(state: TaquinState, final_state: TaquinState) -> float:
+    # Pour chaque pièce, la distance entre sa case actuelle et sa case finale, lue dans la table du but.
+    # La somme donne la distance de manhattan.
+    goal_distances = final_state.goal_distances
+    res = 0
+    for from_index, value in enumerate(state.tiles):
+        res += goal_distances[value][from_index]
     return res
 
 
 def _3x3():
-    from_state = TaquinState([
+    from_state = TaquinState.from_rows([
         [1, 4, 2],
         [7, 6, 3],
         [8, 0, 5]
     ])
 
-    to_state = TaquinState([
+    to_state = TaquinState.from_rows([
         [1, 2, 3],
         [4, 5, 6],
         [7, 8, 0]
@@ -168,14 +419,14 @@ def _3x3():
 
 
 def _4x4():
-    from_state = TaquinState([
+    from_state = TaquinState.from_rows([
         [12, 1, 3, 4],
         [2, 13, 14, 5],
         [11, 10, 8, 6],
         [9, 15, 7, 0]
     ])
 
-    to_state = TaquinState([
+    to_state = TaquinState.from_rows([
         [2, 12, 3, 4],
         [1, 13, 0, 5],
         [11, 14, 7, 8],
@@ -185,6 +436,7 @@ def _4x4():
     wrap_search(from_state, to_state, manhattan, 1, render_node, def_node_attr, "out/taquin/taquin-4x4-manhattan.png", False)
     # wrap_search(from_state, to_state, manhattan, 0.1, render_node, def_node_attr, "out/taquin/taquin-4x4-manhattan-g-s.png", False) # 60s environ 1800 noeuds
     # wrap_search(from_state, to_state, manhattan, 2, render_node, def_node_attr, "out/taquin/taquin-4x4-manhattan-g-b.png", False) # [17-50]s environ 1100-3600 noeuds
+    wrap_search(from_state, to_state, manhattan, 1, render_node, def_node_attr, "out/taquin/taquin-4x4-manhattan-w2.png", False, 2)
     # wrap_search(from_state, to_state, hamming,1, render_node, def_node_attr, "out/taquin/taquin-4x4-hamming.png")  # Trop long !
 
 
@@ -0,0 +1,87 @@
+import importlib.util
+import random
+
+import pytest
+
+from a_star import a_star_search, ara_star_search, bidirectional_a_star_search, ida_star_search
+from distance_cache import DistanceCache
+from external import external_a_star_search
+from hda_star import hda_star_search
+from machine import MachineState, goal_heuristic
+from pattern_db import PatternDatabase
+from sma_star import sma_star_search
+from taquin import TaquinIndex, TaquinState, manhattan
+
+TAQUIN_GOAL = TaquinState.from_rows([[1, 2, 3], [4, 5, 6], [7, 8, 0]])
+MACHINE_GOAL = MachineState(None, [["A", "B", "C", "D", "E", "F"]], 3)
+
+# Chaque moteur est appelé avec (départ, but, heuristique) et doit renvoyer un chemin optimal
+ENGINES = {
+    "a_star": a_star_search,
+    "lean": lambda start, goal, h: a_star_search(start, goal, h, lean=True),
+    "tie_break_h": lambda start, goal, h: a_star_search(start, goal, h, tie_break_h=True),
+    "ida_star": ida_star_search,
+    "bidirectional": bidirectional_a_star_search,
+    "ara_star": ara_star_search,
+    "external": lambda start, goal, h: external_a_star_search(start, goal, h, memory=64),
+    "hda_star": lambda start, goal, h: hda_star_search(start, goal, h, workers=2),
+    "sma_star": lambda start, goal, h: sma_star_search(start, goal, h, max_nodes=2000),
+    "distance_cache": lambda start, goal, h: DistanceCache(1000).search(start, goal, h),
+}
+
+# Moteurs propres au taquin
+TAQUIN_ENGINES = {
+    "lean_index": lambda start, goal, h: a_star_search(start, goal, h, lean=True, index=TaquinIndex(goal)),
+    "pdb": lambda start, goal, _: a_star_search(start, goal, PatternDatabase.build(goal, [(1, 2, 3, 4), (5, 6, 7, 8)])),
+}
+if importlib.util.find_spec("numpy") is not None:
+    TAQUIN_ENGINES["batch"] = lambda start, goal, h: a_star_search(start, goal, h, batch_size=16)
+
+
+def random_walk(state, length: int, rng: random.Random):
+    for _ in range(length):
+        state = rng.choice(state.children())
+    return state
+
+
+def taquin_instances() -> list[TaquinState]:
+    rng = random.Random(0)
+    return [random_walk(TAQUIN_GOAL, 40, rng) for _ in range(5)]
+
+
+def machine_instances() -> list[MachineState]:
+    rng = random.Random(0)
+    # Un nombre pair de mouvements pour finir avec le bras vide
+    return [random_walk(MACHINE_GOAL, 16, rng) for _ in range(5)]
+
+
+def check_path(result, start, goal, children=lambda state: state.children()) -> int:
+    assert result is not None
+    assert result.path[0] == start
+    assert result.path[-1] == goal
+    for parent, child in zip(result.path, result.path[1:]):
+        assert child in children(parent)
+    return len(result.path) - 1
+
+
+def machine_children(state: MachineState) -> list[MachineState]:
+    # Un état du chemin peut venir de la recherche arrière : son picked_from décrit un autre parent
+    return MachineState(state.arm, state.stacks, state.max_stacks).children()
+
+
+@pytest.mark.parametrize("engine", list(ENGINES) + list(TAQUIN_ENGINES))
+def test_taquin(engine):
+    search = {**ENGINES, **TAQUIN_ENGINES}[engine]
+    for start in taquin_instances():
+        optimum = len(a_star_search(start, TAQUIN_GOAL, manhattan).path) - 1
+        assert check_path(search(start, TAQUIN_GOAL, manhattan), start, TAQUIN_GOAL) == optimum
+
+
+@pytest.mark.parametrize("engine", list(ENGINES))
+def test_machine(engine):
+    h = goal_heuristic(MACHINE_GOAL)
+    for start in machine_instances():
+        # Référence sans heuristique : elle ne dépend pas de l'admissibilité de goal_heuristic
+        optimum = len(a_star_search(start, MACHINE_GOAL, lambda *_: 0).path) - 1
+        result = ENGINES[engine](start, MACHINE_GOAL, h)
+        assert check_path(result, start, MACHINE_GOAL, machine_children) == optimum
@@ -0,0 +1,20 @@
+import pytest
+
+from grid import Grid
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_jps_matches_a_star(seed):
+    grid = Grid.random(40, 40, 0.25, seed=seed, diagonal=True)
+    start = grid.index(0, 0)
+    goal = grid.index(grid.width - 1, grid.height - 1)
+    grid.cells[start] = grid.cells[goal] = 0
+
+    a_star = grid.search(start, goal)
+    jps = grid.search(start, goal, jps=True)
+
+    assert (a_star is None) == (jps is None)
+    if a_star is not None:
+        assert jps.g_score[goal] == pytest.approx(a_star.g_score[goal])
+        path = grid.expand_path(jps.path)
+        assert all(grid.is_free(node) for node in path)
@@ -0,0 +1,22 @@
+import pickle
+
+from taquin import TaquinState
+
+
+def test_shapes_do_not_collide():
+    # Même ordre des pièces, et donc même code, sur deux formes différentes
+    wide = TaquinState.from_rows([[1, 2, 3], [4, 5, 0]])
+    tall = TaquinState.from_rows([[1, 2], [3, 4], [5, 0]])
+
+    assert wide.code == tall.code
+    assert wide != tall
+    assert len({wide, tall}) == 2
+
+
+def test_equality():
+    state = TaquinState.from_rows([[1, 2, 3], [4, 5, 0]])
+
+    assert state == TaquinState.from_rows([[1, 2, 3], [4, 5, 0]])
+    assert state == pickle.loads(pickle.dumps(state))
+    assert state != None  # noqa: E711
+    assert state != state.code
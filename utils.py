@@ -21,3 +21,17 @@ def deepcopy2d(x: list) -> list:
     :return: La copie de la liste.
     """
     return [row[:] for row in x]
+
+
+def require_numpy():
+    """
+    numpy est optionnel : seules les évaluations groupées des heuristiques en ont besoin. Il n'est importé qu'au
+    premier appel, pour ne pas ralentir le chargement des autres modules.
+
+    :return: Le module numpy, ou lève ImportError s'il n'est pas installé.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy est nécessaire pour l'évaluation groupée des heuristiques") from None
+    return numpy